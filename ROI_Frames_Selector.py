@@ -5,47 +5,817 @@ Created in April 2020 for UCL EIL
 @author: Anand Pallipurath
 """
 import os, re
+import time
+ImportStarted = time.perf_counter() # The startup timings (see StartupTimer) are measured from here.
+import ast
 import configparser
-import numpy as np
-import skimage.util as util
-import skimage.exposure as exposure
-import skimage.transform as transform
+import argparse
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import importlib
+import itertools
+import json
+import csv
+import subprocess
+import sys
+import glob
+import queue
+import socket
+import threading
 import tkinter
 import tkinter.font as font
 import tkinter.filedialog as filedialog
-import imageio
-import PIL.Image, PIL.ImageTk
 
-#  Load the configuration file
+class LazyModule:
+    # Stand-in for one of the imaging modules (NumPy, imageio, Pillow, tifffile), which together take most of a second to import, and several
+    # seconds from a network drive. The module is imported the first time one of its attributes is used and then replaces the stand-in in the
+    # globals of this file, so that later uses go straight to the module. warm_up() imports them in the background while a file is being picked.
+    lock = threading.RLock() # Held during the import, so that the Tkinter thread waits for an import that the warm-up thread has started.
+    
+    def __init__(self, alias, names, optional = False):
+        self.module_alias = alias
+        self.module_names = names
+        self.module_optional = optional
+    
+    # The module, or None if it is optional and not installed.
+    def import_module(self):
+        with LazyModule.lock:
+            module = globals()[self.module_alias]
+            if module is self:
+                try:
+                    for name in self.module_names:
+                        importlib.import_module(name)
+                    module = sys.modules[self.module_names[0].split(".")[0]]
+                except ImportError:
+                    if self.module_optional == False:
+                        raise
+                    module = None
+                globals()[self.module_alias] = module
+            return module
+    
+    def __getattr__(self, attribute):
+        module = self.import_module()
+        if module is None:
+            raise AttributeError("\n\n" + self.module_names[0] + " is not installed. \n")
+        return getattr(module, attribute)
+
+np = LazyModule("np", ("numpy",))
+imageio = LazyModule("imageio", ("imageio",))
+PIL = LazyModule("PIL", ("PIL.Image", "PIL.ImageTk"))
+tifffile = LazyModule("tifffile", ("tifffile",), optional = True) # Optional: without tifffile, TIFF files are always read through imageio.
+
+# Whether the optional module imported as alias (e.g. "tifffile") is installed.
+def installed(alias):
+    module = globals()[alias]
+    if isinstance(module, LazyModule):
+        module = module.import_module()
+    return module is not None
+
+#  Load the configuration file, from the folder of this file so that the program can be started (or imported) from any working directory
 ConfigParser = configparser.ConfigParser()
-ConfigParser.read('ROI_Frames_Selector.cfg')
-#  Load FFMPEG file extensions from settings
-FFMPEGFileExtensions = ConfigParser.get("SETTINGS", "FFMPEGFileExtensions")
+ConfigParser.read(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ROI_Frames_Selector.cfg'))
+#  Load FFMPEG file extensions from settings. Both lists are parsed into sets of lower-case extensions, so that a file type is matched exactly and in constant time.
+FFMPEGFileExtensions = frozenset(extension.lower() for extension in ast.literal_eval(ConfigParser.get("SETTINGS", "FFMPEGFileExtensions")))
 # Load list of single image filetypes from settings
-ImageFileExtensions = ConfigParser.get("SETTINGS", "ImageFileExtensions")
+ImageFileExtensions = frozenset(extension.lower() for extension in ast.literal_eval(ConfigParser.get("SETTINGS", "ImageFileExtensions")))
+# Load the memory budget (in MB) of the decoded frame cache and the number of frames to prefetch in the direction of travel.
+# Three quarters of the budget go to display-ready frames and a quarter to the tiles of zoomed views.
+FrameCacheMB = ConfigParser.getint("SETTINGS", "FrameCacheMB", fallback = 256)
+PrefetchFrames = ConfigParser.getint("SETTINGS", "PrefetchFrames", fallback = 4)
+# JPEG files can be decoded straight at 1/2, 1/4 or 1/8 of their size (Pillow's draft mode), which is much cheaper than a full decode followed by a resize.
+JPEGFileExtensions = (".jpg", ".jpeg", ".jpe", ".jfif")
+# Load how frames are mapped to 8-bit for display: "dataset" uses one pair of intensity limits for the whole dataset (taken from percentiles of
+# IntensitySampleFrames frames), "frame" stretches every frame between its own min and max.
+IntensityMode = ConfigParser.get("SETTINGS", "IntensityMode", fallback = "dataset")
+IntensityPercentiles = [float(p) for p in ConfigParser.get("SETTINGS", "IntensityPercentiles", fallback = "0.1, 99.9").split(",")]
+IntensitySampleFrames = ConfigParser.getint("SETTINGS", "IntensitySampleFrames", fallback = 16)
+# Load the folder where indexes of opened datasets are kept between sessions (defaults to ~/.cache/ROI_Frames_Selector)
+CacheDirectory = os.path.expanduser(ConfigParser.get("SETTINGS", "CacheDirectory", fallback = "") or os.path.join("~", ".cache", "ROI_Frames_Selector"))
+# Load the disk budget (in MB) of the display-resolution proxies of all datasets in CacheDirectory. 0 disables the proxies.
+ProxyCacheMB = ConfigParser.getint("SETTINGS", "ProxyCacheMB", fallback = 4096)
+# Load whether the sorted listing of every image folder opened is kept in CacheDirectory, so that reopening a large folder skips the sort.
+CacheFolderListings = ConfigParser.getboolean("SETTINGS", "CacheFolderListings", fallback = True)
+# Load whether multi-frame datasets show the panel with the mean, max and std intensity of the ROI over all frames.
+ShowIntensityTrace = ConfigParser.getboolean("SETTINGS", "ShowIntensityTrace", fallback = True)
+# Load how far (in robust standard deviations above the median) the change between consecutive frames must be for a frame to count as active
+# when suggesting frames of interest.
+ActivityThreshold = ConfigParser.getfloat("SETTINGS", "ActivityThreshold", fallback = 3)
+# Load the performance instrumentation settings: PerformanceOverlay shows the latency of every stage of the frame pipeline and the cache hit
+# rate over the frame (F12 toggles it at any time), and PerformanceTrace is a file that every timing is appended to as a JSON line.
+# Nothing is timed unless one of them is set.
+PerformanceOverlay = ConfigParser.getboolean("SETTINGS", "PerformanceOverlay", fallback = False)
+PerformanceTrace = os.path.expanduser(ConfigParser.get("SETTINGS", "PerformanceTrace", fallback = ""))
+
+# Size (rows, columns) of a frame of the given shape once scaled for display. This matches the output size of skimage.transform.rescale,
+# so the mapping of display coordinates back to the original pixels (divide by scale_factor) is unchanged.
+def display_shape(shape, scale_factor):
+    return (int(np.round(shape[0]*scale_factor)), int(np.round(shape[1]*scale_factor)))
+
+# Key under which anything derived from a file or folder is cached in CacheDirectory. Any change to the path, size or modification time gives a new key.
+def dataset_key(path):
+    status = os.stat(path)
+    return hashlib.sha1(("%s|%d|%d" % (os.path.abspath(path), status.st_mtime_ns, status.st_size)).encode("utf-8")).hexdigest()[:20]
+
+class StageTimer:
+    # Wall-clock time of the stages of opening a dataset and of the frame pipeline. Each stage keeps its last 1000 timings for the overlay
+    # and, if trace_file is given, every timing is appended to it as a JSON line. A disabled timer hands out one shared do-nothing context,
+    # so an instrumented stage costs a single method call when timing is off. The stages of the frame pipeline also run in background workers
+    # (prefetch, scrub decoder, proxies, activity detection): timed off the Tkinter thread they are kept apart, as bg_decode and so on.
+    NoStage = contextlib.nullcontext()
+    SharedStages = ("decode", "normalise", "resize")
+    
+    def __init__(self, enabled, trace_file = "", dataset = None):
+        self.enabled = enabled
+        self.dataset = dataset
+        self.samples = collections.defaultdict(lambda: collections.deque(maxlen = 1000))
+        self.lock = threading.Lock() # Stages are timed on the Tkinter thread and on the background threads alike.
+        self.file = None
+        if enabled == True and trace_file != "":
+            try:
+                self.file = open(trace_file, "a", buffering = 1) # Line-buffered: a trace cut short by a crash is still readable
+            except OSError:
+                self.file = None
+        self.host = socket.gethostname()
+    
+    def stage(self, name):
+        if self.enabled == False:
+            return StageTimer.NoStage
+        if name in StageTimer.SharedStages and threading.current_thread() is not threading.main_thread():
+            name = "bg_" + name
+        return TimedStage(self, name)
+    
+    def record(self, name, seconds):
+        with self.lock:
+            self.samples[name].append(seconds)
+            if self.file is not None:
+                self.file.write(json.dumps({"time": time.time(), "host": self.host, "pid": os.getpid(), "dataset": self.dataset, "stage": name, "ms": round(seconds*1000, 3)}) + "\n")
+    
+    # {stage: (number of timings, 50th, 90th and 99th percentile in ms)} over the last 1000 timings of every stage.
+    def percentiles(self):
+        with self.lock:
+            samples = {name: np.array(values) for name, values in self.samples.items() if len(values) > 0}
+        return {name: (len(values),) + tuple(np.percentile(values, (50, 90, 99))*1000) for name, values in samples.items()}
+    
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+class TimedStage:
+    __slots__ = ("timer", "name", "start")
+    
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+    
+    def __exit__(self, *exception):
+        self.timer.record(self.name, time.perf_counter()-self.start)
+
+# Timings of starting the program: importing this file (import), until the file selector is on screen (first_window, both from the start of
+# the import) and importing each imaging module in the background (import_numpy, import_PIL, ..., see warm_up()). Shown in the overlay.
+StartupTimer = StageTimer(PerformanceOverlay == True or PerformanceTrace != "", PerformanceTrace)
+
+# Import the imaging modules, and find the ffmpeg executable, in a background thread, so that they are ready by the time a dataset is opened.
+def warm_up():
+    def run():
+        for alias in ("np", "PIL", "imageio", "tifffile"):
+            module = globals()[alias]
+            if isinstance(module, LazyModule):
+                with StartupTimer.stage("import_" + module.module_names[0].split(".")[0]):
+                    module.import_module()
+        with StartupTimer.stage("import_ffmpeg"):
+            try:
+                import imageio_ffmpeg
+                imageio_ffmpeg.get_ffmpeg_exe()
+            except (ImportError, RuntimeError): # Videos cannot be opened then, which VideoBrowser reports when one is selected.
+                pass
+    threading.Thread(target = run, daemon = True).start()
+
+# Natural sort key: runs of digits compare as numbers ("frame2.tif" before "frame10.tif") and everything else case-insensitively.
+NumberRuns = re.compile("([0-9]+)")
+def natural_sort_key(text):
+    parts = NumberRuns.split(text.lower())
+    parts[1::2] = map(int, parts[1::2]) # split() with a capture group puts the digit runs at the odd positions
+    return parts
+
+class FolderListing:
+    # Names of the frames of an image folder (files with an extension in ImageFileExtensions), in natural order. The sorted listing is saved
+    # as JSON in CacheDirectory, keyed by the path and modification time of the folder, which change whenever a file is added, removed or renamed,
+    # and by ImageFileExtensions, which decides which files are frames.
+    def __init__(self, directory):
+        self.directory = directory
+        extensions = hashlib.sha1(repr(sorted(ImageFileExtensions)).encode("utf-8")).hexdigest()[:8]
+        self.cache_file = os.path.join(CacheDirectory, dataset_key(directory) + "-" + extensions + ".listing.json")
+    
+    def load(self):
+        if CacheFolderListings == False:
+            return None
+        try:
+            with open(self.cache_file) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+    
+    # Names of the frames, unsorted, as they are found. os.scandir() gets the file type along with the name, so nothing else is read from disk.
+    def scan(self):
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                dot = entry.name.rfind(".")
+                if dot > 0 and entry.name[dot:].lower() in ImageFileExtensions and entry.is_file():
+                    yield entry.name
+    
+    def sort(self, names):
+        names = sorted(names, key = natural_sort_key)
+        if CacheFolderListings == True:
+            try:
+                os.makedirs(CacheDirectory, exist_ok = True)
+                with open(self.cache_file, "w") as file:
+                    json.dump(names, file)
+            except OSError: # The listing is only a shortcut for the next session.
+                pass
+        return names
+
+class KeyframeIndex:
+    # Frame indices and timestamps of the keyframes of a video. The index is recorded on the first pass over a video (ffmpeg decodes only
+    # its keyframes, which takes seconds rather than minutes) and saved as JSON in CacheDirectory, keyed by path, size and modification time.
+    def __init__(self, filename, fps):
+        self.filename = filename
+        self.fps = fps
+        self.keyframes = None # Frame index of every keyframe, in increasing order
+        self.times = None # Seek position (in seconds from the start of the video) of every keyframe
+        self.cache_file = os.path.join(CacheDirectory, dataset_key(filename) + ".keyframes.json")
+    
+    def load(self):
+        try:
+            with open(self.cache_file) as file:
+                table = json.load(file)
+        except (OSError, ValueError):
+            return False
+        if table.get("fps") != self.fps:
+            return False
+        self.keyframes, self.times = table["keyframes"], table["times"]
+        return True
+    
+    def build(self):
+        import imageio_ffmpeg
+        command = [imageio_ffmpeg.get_ffmpeg_exe(), "-hide_banner", "-nostats", "-skip_frame", "nokey", "-i", self.filename, "-map", "0:v:0", "-vf", "showinfo", "-f", "null", "-"]
+        log = subprocess.run(command, stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, check = True).stderr.decode("utf-8", "replace")
+        timestamps = [float(t) for t in re.findall(r"pts_time:\s*(-?[0-9.]+)", log)]
+        if timestamps == []:
+            raise RuntimeError("\n\nNo keyframes found in " + self.filename + ". \n")
+        # Timestamps are counted from the first frame, which is always a keyframe, as are ffmpeg's -ss seek positions.
+        self.times = [t - timestamps[0] for t in timestamps]
+        self.keyframes = [int(np.round(t*self.fps)) for t in self.times]
+        os.makedirs(CacheDirectory, exist_ok = True)
+        with open(self.cache_file + ".tmp", "w") as file:
+            json.dump({"filename": os.path.abspath(self.filename), "fps": self.fps, "keyframes": self.keyframes, "times": self.times}, file)
+        os.replace(self.cache_file + ".tmp", self.cache_file)
+
+class KeyframeSeekReader:
+    # Random access into a video through its KeyframeIndex, with the same get_data(), get_meta_data(), get_length(), count_frames() and close()
+    # interface as the imageio reader it replaces, whose metadata it is given.
+    # A seek restarts ffmpeg exactly at the keyframe at or before the requested frame and decodes forward from there, so a backward step or a
+    # slider jump costs at most one GOP of decoding (imageio re-seeks up to 10 s before the requested frame). Frames decoded on the way to the
+    # requested one are handed to on_skip(index, frame), if set, so that stepping backward through the same GOP can be served from a cache.
+    def __init__(self, keyframe_index, meta):
+        self.index = keyframe_index
+        self.meta = meta
+        self.width, self.height = meta["size"]
+        self.generator = None
+        self.position = -1 # Index of the last frame read from the generator
+        self.on_skip = None
+    
+    def get_data(self, index):
+        if index < 0:
+            raise IndexError("Frame index must be >= 0")
+        keyframe = bisect.bisect_right(self.index.keyframes, index) - 1
+        # Keep decoding forward unless the requested frame is behind us or a keyframe closer to it is available.
+        if self.generator is None or index <= self.position or self.index.keyframes[keyframe] > self.position + 1:
+            self.seek(keyframe)
+        while self.position < index - 1:
+            frame = self.read()
+            if self.on_skip is not None:
+                self.on_skip(self.position, frame)
+        return self.read()
+    
+    def seek(self, keyframe):
+        import imageio_ffmpeg
+        self.close()
+        # -noaccurate_seek makes ffmpeg start at the keyframe itself. The quarter-frame margin keeps rounding from landing on the previous keyframe.
+        seek = ["-noaccurate_seek", "-ss", "%.6f" % (self.index.times[keyframe] + 0.25/self.index.fps)] if keyframe > 0 else []
+        self.generator = imageio_ffmpeg.read_frames(self.index.filename, pix_fmt = "rgb24", input_params = seek)
+        next(self.generator) # The first item is the metadata.
+        self.position = self.index.keyframes[keyframe] - 1
+    
+    def read(self):
+        try:
+            data = next(self.generator)
+        except StopIteration:
+            self.close()
+            raise IndexError("Reached end of video")
+        self.position += 1
+        return np.frombuffer(data, dtype = np.uint8).reshape(self.height, self.width, 3)
+    
+    def get_meta_data(self):
+        return self.meta
+    
+    # Like the imageio reader, in "stream mode": the length of a video is only known once count_frames() has scanned it.
+    def get_length(self):
+        return float("inf")
+    
+    def count_frames(self):
+        import imageio_ffmpeg
+        return imageio_ffmpeg.count_frames_and_secs(self.index.filename)[0]
+    
+    def close(self):
+        if self.generator is not None:
+            self.generator.close()
+            self.generator = None
+        self.position = -1
+
+class ProxyStore:
+    # Persistent store of the display-ready (8-bit, display-sized) frames of a dataset, so that reopening it does not decode, normalise and resize
+    # every frame again. Frames live in a memory-mapped .npy file in CacheDirectory/proxies, with a second .npy file flagging the frames stored
+    # so far; get() returns a zero-copy slice of the memory map. Stores of all datasets together are kept under limit_bytes by deleting the least
+    # recently opened ones. A dataset too large for limit_bytes keeps every stride-th frame only. Raises ValueError if not even one frame fits.
+    # Flags are only written to disk by flush(), after the frames they flag, so a crash never leaves a frame flagged without its pixels.
+    def __init__(self, key, number_frames, shape, limit_bytes):
+        frame_bytes = int(np.prod(shape)) + 1
+        self.number_frames = number_frames
+        self.stride = -(-number_frames//max(1, min(number_frames, limit_bytes//frame_bytes)))
+        capacity = -(-number_frames//self.stride)
+        self.folder = os.path.join(CacheDirectory, "proxies")
+        if self.stride > 1:
+            key += "-every%d" % self.stride
+        self.frames_file = os.path.join(self.folder, key + ".frames.npy")
+        self.filled_file = os.path.join(self.folder, key + ".filled.npy")
+        try:
+            self.frames = np.load(self.frames_file, mmap_mode = "r+")
+            self.filled = np.load(self.filled_file, mmap_mode = "r+")
+            if self.frames.shape != (capacity,) + tuple(shape) or self.filled.shape != (capacity,):
+                raise ValueError
+        except (OSError, ValueError):
+            size = capacity*frame_bytes
+            if size > limit_bytes:
+                raise ValueError("\n\nProxies of this dataset do not fit in ProxyCacheMB. \n")
+            os.makedirs(self.folder, exist_ok = True)
+            self.evict(limit_bytes - size)
+            self.frames = np.lib.format.open_memmap(self.frames_file, mode = "w+", dtype = np.uint8, shape = (capacity,) + tuple(shape))
+            self.filled = np.lib.format.open_memmap(self.filled_file, mode = "w+", dtype = bool, shape = (capacity,))
+        os.utime(self.frames_file) # Marks this store as the most recently used one.
+        self.stored = np.array(self.filled) # Frames stored so far, including those not flagged on disk yet
+        self.pending = [] # Slots stored since the last flush()
+        self.lock = threading.Lock()
+    
+    # Delete the least recently opened stores until all stores together take at most limit_bytes.
+    def evict(self, limit_bytes):
+        stores = []
+        for frames_file in glob.glob(os.path.join(self.folder, "*.frames.npy")):
+            filled_file = frames_file[:-len(".frames.npy")] + ".filled.npy"
+            try:
+                size = os.path.getsize(frames_file) + (os.path.getsize(filled_file) if os.path.exists(filled_file) else 0)
+                stores.append((os.path.getmtime(frames_file), size, frames_file, filled_file))
+            except OSError:
+                continue
+        total = sum(store[1] for store in stores)
+        for mtime, size, frames_file, filled_file in sorted(stores):
+            if total <= limit_bytes:
+                break
+            try:
+                os.remove(frames_file)
+                if os.path.exists(filled_file):
+                    os.remove(filled_file)
+                total -= size
+            except OSError: # Still open elsewhere (e.g. on Windows): leave it.
+                pass
+    
+    def __contains__(self, index):
+        return 0 <= index < self.number_frames and index % self.stride == 0 and self.stored[index//self.stride]
+    
+    # Whether every frame of the dataset is stored.
+    def complete(self):
+        return self.stride == 1 and bool(self.stored.all())
+    
+    def get(self, index):
+        if index in self:
+            return self.frames[index//self.stride]
+        return None
+    
+    def put(self, index, frame):
+        # Frames of an image sequence may differ in size; only those matching the store are kept.
+        if 0 <= index < self.number_frames and index % self.stride == 0 and frame.shape == self.frames.shape[1:]:
+            self.frames[index//self.stride] = frame
+            with self.lock:
+                self.stored[index//self.stride] = True
+                self.pending.append(index//self.stride)
+    
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, []
+        self.frames.flush()
+        self.filled[pending] = True
+        self.filled.flush()
+
+# Mean squared difference of every frame of a batch (n × h × w float32 array) with the frame before it. previous is the last frame of the
+# batch before, or None for the first batch, whose first frame then gets 0.
+def difference_energy(frames, previous):
+    if previous is not None:
+        frames = np.concatenate((previous[None], frames))
+    energy = np.square(np.diff(frames, axis = 0)).mean(axis = (1, 2))
+    return energy if previous is not None else np.concatenate(([0], energy))
+
+# Suggest (first_frame, last_frame) around the frames whose difference energy stands out from the static background, i.e. is more than
+# threshold standard deviations above the background level. Level and standard deviation of the background are estimated from the 5th and
+# 10th percentiles of the energies (1.6449 and 1.2816 standard deviations below the mean of a normal distribution), so a tenth of the frames
+# must be background. Energies are in squared grey levels of 8-bit frames, and the standard deviation is taken as at least one grey level and
+# 5% of the median energy: a background that does not change at all has no spread, which would make any tiny change count as activity.
+# If the quietest frames differ from each other by more than a quarter of their level, there is no static background (something changes in
+# every frame) and the whole clip is suggested. The range is widened by margin of its length on both sides. Returns None if no frame stands out.
+def suggest_frame_range(energy, threshold = 3, margin = 0.05):
+    if len(energy) < 2:
+        return None
+    level, low = np.percentile(energy[1:], [5, 10]) # energy[0] has no frame before it
+    spread = (low-level)/(1.6449-1.2816)
+    if spread > max(0.25*level, 1.0):
+        return (0, len(energy)-1)
+    spread = max(spread, 0.05*np.median(energy[1:]), 1.0)
+    active = np.flatnonzero(energy > low + (1.2816+threshold)*spread)
+    if len(active) == 0:
+        return None
+    first, last = max(active[0]-1, 0), active[-1] # The first active frame differs from the one before it, where the change starts.
+    padding = int(np.round(margin*(last-first+1)))
+    return (int(max(first-padding, 0)), int(min(last+padding, len(energy)-1)))
+
+class IntensityTrace:
+    # Mean, maximum and standard deviation of the pixels inside a ROI, for every frame of a dataset (NaN until computed). Saved as .npy in
+    # CacheDirectory under the dataset key and the ROI, so drawing the same ROI again, in this session or a later one, only computes the frames still missing.
+    def __init__(self, key, number_frames):
+        self.cache_file = os.path.join(CacheDirectory, key + ".trace.npy")
+        try:
+            self.values = np.load(self.cache_file)
+            if self.values.shape != (number_frames, 3):
+                raise ValueError
+        except (OSError, ValueError):
+            self.values = np.full((number_frames, 3), np.nan)
+    
+    # First frame of every chunk of chunk_frames frames that is not complete.
+    def missing(self, chunk_frames):
+        return [start for start in range(0, len(self.values), chunk_frames) if np.isnan(self.values[start:start+chunk_frames, 0]).any()]
+    
+    def put(self, start, values):
+        self.values[start:start+len(values)] = values
+    
+    def save(self):
+        try:
+            os.makedirs(CacheDirectory, exist_ok = True)
+            np.save(self.cache_file, self.values)
+        except OSError: # The trace is only a shortcut for the next time the ROI is drawn.
+            pass
+
+class ScrubDecoder(threading.Thread):
+    # Background decoder for slider scrubbing that only ever works on the latest request: a request that arrives while a frame is being decoded
+    # replaces any request still waiting, so dragging the slider never builds up a backlog of stale frames. Each decoded frame is posted to
+    # the events queue as (deliver, (index, frame)) for the Tkinter thread to pick up.
+    def __init__(self, load_frame, events, deliver):
+        super().__init__(daemon = True)
+        self.load_frame = load_frame
+        self.events = events
+        self.deliver = deliver
+        self.condition = threading.Condition()
+        self.pending = None
+        self.stopped = False
+    
+    def request(self, index):
+        with self.condition:
+            self.pending = index
+            self.condition.notify()
+    
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+    
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and self.stopped == False:
+                    self.condition.wait()
+                if self.stopped == True:
+                    return
+                index, self.pending = self.pending, None
+            try:
+                frame = self.load_frame(index)
+            except Exception: # The frame is decoded again (and any error reported) when the slider is released.
+                continue
+            self.events.put((self.deliver, (index, frame)))
+
+# Memory map an uncompressed TIFF file (single image or stack) or a .npy file as an array of frames along the first axis. Returns None if the file
+# cannot be memory-mapped (compressed or non-contiguous TIFF data, pickled .npy, other file types), in which case it is read through imageio.
+# A .npy array whose last axis has 3 or 4 entries holds RGB(A) frames. TIFF files say so in the axes of their series ("S" for samples), which are
+# moved last if they are stored planar (e.g. "SYX"). The TIFF header is parsed once, and the data mapped at the offset it gives.
+def memmap_file(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    try:
+        if extension == ".npy":
+            frames = np.load(filename, mmap_mode = "r")
+            rgb = frames.ndim >= 3 and frames.shape[-1] in (3, 4)
+        elif (extension == ".tif" or extension == ".tiff") and installed("tifffile") == True:
+            with tifffile.TiffFile(filename) as tif:
+                if len(tif.series) != 1: # Pages written one series each (e.g. by imageio.mimwrite): only the first would be mapped.
+                    return None
+                series = tif.series[0]
+                if series.dataoffset is None or series.dtype is None:
+                    return None
+                frames = np.memmap(filename, np.dtype(tif.byteorder + series.dtype.char), "r", series.dataoffset, series.shape, "C")
+                rgb = "S" in series.axes
+                if rgb == True:
+                    frames = np.moveaxis(frames, series.axes.index("S"), -1)
+                    if frames.shape[-1] not in (3, 4):
+                        return None
+        else:
+            return None
+    except (OSError, ValueError, TypeError, IndexError):
+        return None
+    if frames.ndim < (3 if rgb else 2) or frames.size == 0:
+        return None
+    # Every axis before the image (and colour) axes indexes frames, e.g. the pages of a stack.
+    return frames.reshape((-1,) + frames.shape[frames.ndim-(3 if rgb else 2):])
+
+class MemmapFrames:
+    # Frame source over a memory-mapped file, with the get_data()/get_length()/close() interface of an imageio reader. get_data() returns a
+    # zero-copy view of the file, so stepping through an uncompressed stack costs a page-in of the frame instead of a decode plus an allocation.
+    def __init__(self, frames):
+        self.frames = frames
+    
+    def get_data(self, index):
+        if index < 0 or index >= len(self.frames):
+            raise IndexError(index)
+        return self.frames[index]
+    
+    def get_length(self):
+        return len(self.frames)
+    
+    def get_meta_data(self):
+        return {}
+    
+    def close(self):
+        self.frames = None
+
+class TiffPages:
+    # Frame source over the pages of a TIFF stack that cannot be memory-mapped (e.g. compressed), with the same interface. imageio reads a
+    # stack written as a single series as one image holding every page; here each page is a frame, decoded on its own when it is requested.
+    def __init__(self, tif):
+        self.tif = tif
+        self.pages = tif.series[0].pages
+    
+    def get_data(self, index):
+        if index < 0 or index >= len(self.pages):
+            raise IndexError(index)
+        return self.pages[index].asarray()
+    
+    def get_length(self):
+        return len(self.pages)
+    
+    def get_meta_data(self):
+        return {}
+    
+    def close(self):
+        self.tif.close()
+
+class ImageSequence:
+    # Frame source over a folder of single-image files, with the same interface. If the first file can be memory-mapped (uncompressed TIFF, .npy)
+    # files are served as zero-copy views of the file; otherwise, or for any file that cannot be mapped, they are read with imageio.imread.
+    def __init__(self, filelist):
+        self.filelist = filelist
+        self.mappable = memmap_file(filelist[0]) is not None
+    
+    def get_data(self, index):
+        if self.mappable == True:
+            frames = memmap_file(self.filelist[index])
+            if frames is not None:
+                return frames[0]
+        return imageio.imread(self.filelist[index]) #open each image from directory
+    
+    def get_length(self):
+        return len(self.filelist)
+    
+    def get_meta_data(self):
+        return {}
+    
+    def close(self):
+        pass
+
+# Open a single file as a frame source: memory-mapped if possible, page by page for a TIFF stack of a single series, otherwise through
+# imageio.get_reader() as before.
+def open_source(filename):
+    frames = memmap_file(filename)
+    if frames is not None:
+        return MemmapFrames(frames)
+    if os.path.splitext(filename)[1].lower() in (".tif", ".tiff") and installed("tifffile") == True:
+        tif = tifffile.TiffFile(filename)
+        if len(tif.series) == 1 and len(tif.series[0].pages) > 1 and all(page is not None for page in tif.series[0].pages):
+            return TiffPages(tif)
+        tif.close()
+    return imageio.get_reader(filename, mode = '?') #image_set is a reader object with the list of images.
+
+class IntensityMapper:
+    # Maps frames of any dtype (8/16-bit integers, floats, greyscale or RGB) to 8-bit for display in a single vectorised pass.
+    # Integer frames of up to 16 bits go through a lookup table (65536 entries for 16-bit data), so no float copy of the frame is made.
+    # In "dataset" mode the limits are computed once by calibrate() and the lookup tables are reused for every frame, which also keeps the
+    # contrast constant from frame to frame. In "frame" mode every frame is stretched between its own min and max (skimage's rescale_intensity).
+    def __init__(self, mode = "dataset", percentiles = (0.1, 99.9)):
+        if mode != "dataset" and mode != "frame":
+            raise ValueError("\n\nIntensityMode must be 'dataset' or 'frame'. \n")
+        self.mode = mode
+        self.percentiles = percentiles
+        self.limits = None
+        self.luts = {}
+    
+    # Set the intensity limits of the dataset from percentiles of a few sample frames. Each frame is subsampled to ~250k pixels to keep this cheap.
+    def calibrate(self, frames):
+        samples = []
+        for frame in frames:
+            frame = np.asarray(frame)
+            step = max(1, int(np.sqrt(frame.size/2**18)))
+            samples.append(frame[::step, ::step].ravel())
+        low, high = np.percentile(np.concatenate(samples), self.percentiles)
+        self.limits = (float(low), float(high))
+        self.luts = {}
+    
+    # Scale a float32 array from (low, high) to (0, 255) in place and return it as 8-bit.
+    def scale(self, values, low, high):
+        values -= low
+        values *= 255/(high-low) if high > low else 0
+        np.clip(values, 0, 255, out = values)
+        return values.astype(np.uint8)
+    
+    # Entry i holds the 8-bit value of the pixel whose bits read i as an unsigned integer, so that signed data can be looked up through an unsigned view.
+    def lookup_table(self, dtype, low, high):
+        values = np.arange(2**(8*dtype.itemsize), dtype = "uint%d" % (8*dtype.itemsize)).view(dtype).astype(np.float32)
+        return self.scale(values, low, high)
+    
+    def map(self, frame):
+        frame = np.asarray(frame)
+        if self.mode == "dataset" and self.limits is not None:
+            low, high = self.limits
+        else:
+            low, high = float(frame.min()), float(frame.max())
+        if frame.dtype.kind in "ui" and frame.dtype.itemsize <= 2:
+            lut = self.luts.get((frame.dtype, low, high))
+            if lut is None:
+                lut = self.lookup_table(frame.dtype, low, high)
+                if self.mode == "dataset":
+                    self.luts[(frame.dtype, low, high)] = lut
+            return lut[frame.view("uint%d" % (8*frame.dtype.itemsize))]
+        return self.scale(frame.astype(np.float32), low, high)
+
+class FrameCache:
+    # A memory-bounded LRU cache of decoded, display-ready frames keyed by frame index.
+    # The least recently used frames are evicted once the total size of the cached arrays exceeds max_bytes.
+    # Hit/miss counters are kept so that FrameCacheMB in ROI_Frames_Selector.cfg can be tuned (see stats()).
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.frames = collections.OrderedDict()
+        self.keys = [] # The keys of frames, sorted, for nearest()
+        self.lock = threading.Lock() # The prefetch worker and the Tkinter thread share the cache.
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.frames
+
+    def get(self, key):
+        with self.lock:
+            frame = self.frames.get(key)
+            if frame is None:
+                self.misses += 1
+            else:
+                self.frames.move_to_end(key)
+                self.hits += 1
+            return frame
+
+    def put(self, key, frame):
+        with self.lock:
+            if key in self.frames:
+                self.nbytes -= self.frames.pop(key).nbytes
+                del self.keys[bisect.bisect_left(self.keys, key)]
+            if frame.nbytes > self.max_bytes: # Never let a single frame flush the whole cache.
+                return
+            self.frames[key] = frame
+            bisect.insort(self.keys, key)
+            self.nbytes += frame.nbytes
+            while self.nbytes > self.max_bytes:
+                evicted, frame = self.frames.popitem(last = False)
+                self.nbytes -= frame.nbytes
+                del self.keys[bisect.bisect_left(self.keys, evicted)]
+
+    # The cached frame whose key is closest to key, or None if the cache is empty. Used as a stand-in while the frame at key is decoded,
+    # so it is neither a hit nor a miss, and it does not make the frame more recently used.
+    def nearest(self, key):
+        with self.lock:
+            if not self.keys:
+                return None
+            position = bisect.bisect_left(self.keys, key)
+            candidates = self.keys[max(position-1, 0):position+1]
+            return self.frames[min(candidates, key = lambda cached: abs(cached - key))]
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.keys.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits/lookups if lookups else 0.0,
+                    "frames": len(self.frames), "megabytes": self.nbytes/2**20}
+
+class FramePrefetcher(threading.Thread):
+    # Background worker that decodes the next few frames in the direction the user is moving and stores them in a FrameCache,
+    # so that forward(), backward() and short slider moves are served from memory.
+    def __init__(self, load_frame, cache, depth):
+        super().__init__(daemon = True)
+        self.load_frame = load_frame
+        self.cache = cache
+        self.depth = depth
+        self.requests = queue.Queue()
+
+    def request(self, index, step, number_frames):
+        # Only the latest position matters: drop any request that has not been started yet.
+        try:
+            while True:
+                self.requests.get_nowait()
+        except queue.Empty:
+            pass
+        self.requests.put((index, step, number_frames))
+
+    def stop(self):
+        self.request(None, 0, 0)
+
+    def run(self):
+        while True:
+            index, step, number_frames = self.requests.get()
+            if index is None:
+                return
+            for i in range(1, self.depth+1):
+                target = index + i*step
+                if not self.requests.empty() or target < 0 or target >= number_frames: # The user has moved on or we hit either end of the dataset.
+                    break
+                if target in self.cache:
+                    continue
+                try:
+                    self.cache.put(target, self.load_frame(target))
+                except Exception: # A frame that fails to decode here will fail again (and be reported) on the Tkinter thread.
+                    break
 
 class VideoBrowser:
     def __init__(self, window, multimedia=None, ROIshape=0):
         # Create a window and build the Application objects
         self.haserror = False
-        self.window = window
-        self.multimedia = multimedia
         if int(ROIshape) != 0 and int(ROIshape) != 1:
-            self.window.destroy()
+            window.destroy()
             self.haserror = True
             raise ValueError("\n\nROIshape must be 0 for rectangle and 1 for circle. \n")
-        else:
-            self.ROIshape = int(ROIshape)
-        self.window.title(self.multimedia)
+        self.start_opening(multimedia, ROIshape)
+        self.show(window)
+    
+    # Start opening a dataset without a window, to show() it later: BatchAnnotator opens the next dataset while the current one is annotated.
+    @classmethod
+    def preload(cls, multimedia, ROIshape=0):
+        if int(ROIshape) != 0 and int(ROIshape) != 1:
+            raise ValueError("\n\nROIshape must be 0 for rectangle and 1 for circle. \n")
+        browser = cls.__new__(cls)
+        browser.haserror = False
+        browser.start_opening(multimedia, ROIshape)
+        return browser
+    
+    # Stop opening a preloaded dataset that will not be shown.
+    def discard(self):
+        self.stop_opening.set()
+        self.stop_filling.set()
+    
+    # Set up the state of the browser and start open_dataset(). Nothing here touches Tk, which is left to show().
+    def start_opening(self, multimedia, ROIshape):
+        self.multimedia = multimedia
+        self.ROIshape = int(ROIshape)
+        self.timer = StageTimer(PerformanceOverlay == True or PerformanceTrace != "", PerformanceTrace, multimedia)
+        self.opened = time.perf_counter()
+        self.overlay = None # Canvas text with the stage latencies (see update_overlay())
+        self.polls = 0
         self.resolution = 500 # Giving a decent resolution to resize large images to fit a screen
-        self.delay = 100 # set the delay in milliseconds to refresh the Tkinter window.
-        # Create an empty canvas. This creates a separate Tkinter.Tk() object. 'highlightthickness' = 0 is important when dealing with extracting XY coordinates of images through mouse events.
-        # Without highlightthickness, canvas is larger than the image --> leading to mouse picking out of bounds XY coordinates.
-        self.mycanvas = tkinter.Canvas(self.window, width = self.resolution, height = self.resolution, highlightthickness=0)         
-        self.largefont = font.Font(family="Verdana", size=10, weight=font.BOLD)
-        self.mediumfont = font.Font(family="Verdana", size=10, weight=font.BOLD, slant=font.ITALIC)
-        self.specialfont = font.Font(family="Helvetica", size=10, weight=font.BOLD, slant=font.ITALIC)
+        self.delay = 40 # set the delay in milliseconds to refresh the Tkinter window. This is also the frame interval while scrubbing the slider.
         self.index = 0 # Open every dataset at the first frame.
+        self.number_frames = 0 # Set by open_dataset() once the dataset is open
         self.first_frame = None
         self.last_frame = None
         self.x = None
@@ -55,72 +825,241 @@ class VideoBrowser:
         self.start_y = None
         self.curX = None
         self.curY = None
+        self.roi = None # ROI as drawn (X1, Y1, X2, Y2), in original pixel coordinates
         self.resize = False
         self.ROIrect = False
         self.filelist = []
+        self.direction = 1 # Direction of travel through the dataset, used to prefetch frames ahead of the user.
+        self.reader_lock = threading.Lock() # Readers are not thread-safe, so the prefetch worker and the Tkinter thread take turns.
+        self.frame_cache = FrameCache(FrameCacheMB*2**20*3//4)
+        self.prefetcher = FramePrefetcher(self.load_frame, self.frame_cache, PrefetchFrames)
+        self.events = queue.Queue() # Results of background work, handed over to the Tkinter thread by poll_events().
+        self.scrub_decoder = ScrubDecoder(self.cached_frame, self.events, self.show_scrubbed_frame)
+        self.frames_exact = True # False while the number of frames of a video is only an estimate from its metadata.
+        self.proxies = None # ProxyStore of display-ready frames on disk
+        self.stop_filling = threading.Event()
+        self.listing_complete = True # False while the files of a folder are still being sorted: only the first frame is known until then.
+        self.trace_canvas = None # Panel with the intensity trace of the ROI (see update_trace())
+        self.trace = None # IntensityTrace of the current ROI
+        self.traces = {} # IntensityTrace of every ROI drawn, so that going back to a previous ROI does not start over
+        self.trace_pool = None # Worker threads that compute the trace, started with the first ROI
+        self.trace_futures = []
+        self.trace_dirty = False # The trace panel is redrawn at most once per poll_events(), however many chunks came in
+        self.trace_chunk_frames = 64 # Frames per task sent to the worker threads
+        self.trace_height = 80
+        self.stop_detecting = threading.Event()
+        self.suggestion = None # (first_frame, last_frame) proposed by detect_activity()
+        # Zoom (display pixels per original pixel) and the original pixel at the top-left corner of the canvas. At zoom == fit_zoom the whole
+        # frame is shown through the display frame pipeline; when zoomed in, the view is rendered from tiles (see show_view()).
+        self.view_x = 0
+        self.view_y = 0
+        self.max_zoom = 8
+        self.tile_size = 256
+        self.tile_cache = FrameCache(FrameCacheMB*2**20//4) # The rest of FrameCacheMB
+        self.zoom_source = (None, None) # (index, frame) of the last full-resolution frame that tiles were cut from
         
-        # If a single file is selected: use the imageio.getreader() option and check for FFMPEG compatibility.
-        if os.path.isfile(multimedia) == True:
-            #  Get filename file_extension
-            self.file_extension = (os.path.splitext(multimedia)[1])
-            self.image_set = imageio.get_reader(multimedia, mode = '?') #image_set is a reader object with the list of images. This loads the entire file onto memory.
-    
-            #  Check if the imported file is a FFMPEG or some other type
-            self.isFFMPEG = self.file_extension in FFMPEGFileExtensions
-            #  Calculate the number of frames in the file. count_frames() is used for videos otherwise get_length() is used.
-            #  When reading from a video, the number of available frames is hard/expensive to calculate, which is why its
-            #  set to inf by default, indicating “stream mode”. To get the number of frames before having read them all, you
-            #  can use the reader.count_frames() method.
-            #  See: https://imageio.readthedocs.io/en/stable/format_ffmpeg.html#ffmpeg
-            self.number_frames = self.image_set.count_frames() if self.isFFMPEG else self.image_set.get_length()
-            # Create frame and photo here, only to get the aspect ratio of the photo based on which the canvas will be built.
-            self.frame = self.image_set.get_data(self.index) #get_data opens each frame as an image array
-            
-            # Downscale 16-bit images to 8-bit, as PIL.Image cannot open/handle 16-bit images.
-            self.frame = exposure.rescale_intensity(self.frame, out_range=(0, 255)).astype('uint8')
+        # The dataset is opened by a background thread (see open_dataset()), so the window shows its progress and stays responsive meanwhile.
+        self.open_complete = False # True once the widgets are built (see build_browser())
+        self.open_error = None
+        self.open_status = "Starting"
+        self.stop_opening = threading.Event()
+        threading.Thread(target = self.open_dataset, daemon = True).start()
+    
+    # Show the dataset in window, with the progress of open_dataset() until it is open, and run the event loop until the window is closed.
+    def show(self, window):
+        self.window = window
+        self.window.title(self.multimedia)
+        # Create an empty canvas. This creates a separate Tkinter.Tk() object. 'highlightthickness' = 0 is important when dealing with extracting XY coordinates of images through mouse events.
+        # Without highlightthickness, canvas is larger than the image --> leading to mouse picking out of bounds XY coordinates.
+        self.mycanvas = tkinter.Canvas(self.window, width = self.resolution, height = self.resolution, highlightthickness=0)         
+        self.largefont = font.Font(family="Verdana", size=10, weight=font.BOLD)
+        self.mediumfont = font.Font(family="Verdana", size=10, weight=font.BOLD, slant=font.ITALIC)
+        self.specialfont = font.Font(family="Helvetica", size=10, weight=font.BOLD, slant=font.ITALIC)
+        self.mycanvas.grid(row = 1, column = 0, columnspan = 3)
+        self.open_text = self.mycanvas.create_text(self.resolution/2, self.resolution/2, justify = "center", text = "")
+        self.mypic = None # Canvas image of the frame, created by show_preview()
+        self.update_open_text()
+        self.window.protocol("WM_DELETE_WINDOW", self.onclosingwindow)
+        self.poll_id = self.window.after(10, self.poll_events)
+        self.window.mainloop()
+        if self.open_error is not None:
+            raise self.open_error
+    
+    # Runs in a background thread: open the dataset, decode the first frame (shown at once by show_preview()) and calibrate the display, while
+    # the Tkinter thread keeps the window responsive. build_browser() then builds the widgets, after which the background work that reports
+    # back to them (counting the frames of a video, sorting a folder, indexing keyframes) is started, and it unlocks navigation as it finishes.
+    def open_dataset(self):
+        background = [] # (target, args) of the threads to start once the widgets exist
+        self.frame = None
+        self.display_prepared = False # Whether prepare_display() has run for self.frame
+        try:
+            # If a single file is selected: use the imageio.getreader() option and check for FFMPEG compatibility.
+            if os.path.isfile(self.multimedia) == True:
+                #  Get filename file_extension
+                self.file_extension = (os.path.splitext(self.multimedia)[1]).lower()
+                self.events.put((self.set_open_progress, ("Opening the file",)))
+                with self.timer.stage("open_reader"):
+                    self.image_set = open_source(self.multimedia) #image_set is a reader object with the list of images, memory-mapped for uncompressed TIFF and .npy files.
+    
+                #  Check if the imported file is a FFMPEG or some other type
+                self.isFFMPEG = self.file_extension in FFMPEGFileExtensions
+                #  Calculate the number of frames in the file. count_frames() is used for videos otherwise get_length() is used.
+                #  When reading from a video, the number of available frames is hard/expensive to calculate, which is why its
+                #  set to inf by default, indicating “stream mode”. To get the number of frames before having read them all, you
+                #  can use the reader.count_frames() method.
+                #  See: https://imageio.readthedocs.io/en/stable/format_ffmpeg.html#ffmpeg
+                #  count_frames() scans the whole video, so the browser opens with an estimate from the container metadata and
+                #  the exact count replaces it when count_frames() finishes in the background (see set_number_frames()).
+                if self.isFFMPEG == True:
+                    self.number_frames = self.estimate_frames()
+                    if self.number_frames > 1:
+                        self.frames_exact = False
+                        background.append((self.count_frames, ()))
+                    else:
+                        self.events.put((self.set_open_progress, ("Counting the frames",)))
+                        self.number_frames = self.image_set.count_frames()
+                else:
+                    self.number_frames = self.image_set.get_length()
+                # Create frame and photo here, only to get the aspect ratio of the photo based on which the canvas will be built.
+                self.events.put((self.set_open_progress, ("Decoding the first frame",)))
+                with self.timer.stage("first_frame"):
+                    self.frame = self.image_set.get_data(self.index) #get_data opens each frame as an image array
             
-        elif os.path.isdir(multimedia) == True: # Else if a directory of image sequence is selected: use the imageio.imread() option to open frames.
-            for file in os.listdir(multimedia):
-                self.file_extension = (os.path.splitext(file)[1])
-                #  Check if the imported file is a compatible single image
-                self.isSingleImage = self.file_extension in ImageFileExtensions
-                if self.isSingleImage == True and self.file_extension != "":
-                    self.filelist.append(os.path.join(multimedia, file))
-            if self.filelist != []:
-                self.filelist = self.sorted_alphanumeric(self.filelist)
-                self.number_frames = len(self.filelist)
-                self.frame = imageio.imread(self.filelist[self.index]) #open each image from directory
-                self.frame = exposure.rescale_intensity(self.frame, out_range=(0, 255)).astype('uint8')
+            elif os.path.isdir(self.multimedia) == True: # Else if a directory of image sequence is selected: use the imageio.imread() option to open frames.
+                # A listing saved by a previous session is used as-is. Otherwise the folder is scanned in a single pass: the first image found is
+                # shown straight away while the scan goes on, then the first frame in natural order. The full sort runs in the background
+                # (see sort_listing()); until then the other frames are in directory order.
+                self.listing = FolderListing(self.multimedia)
+                self.events.put((self.set_open_progress, ("Listing the folder",)))
+                prefix = os.path.join(self.multimedia, "")
+                names = self.listing.load()
+                if names is None:
+                    found = self.listing.scan()
+                    names = list(itertools.islice(found, 1))
+                    if names != []:
+                        with self.timer.stage("first_frame"):
+                            self.frame = ImageSequence([prefix + names[0]]).get_data(0)
+                        self.prepare_display()
+                    with self.timer.stage("scan"):
+                        names.extend(found)
+                    if len(names) > 1:
+                        first = names.index(min(names, key = natural_sort_key))
+                        names[0], names[first] = names[first], names[0]
+                        self.listing_complete = False
+                        background.append((self.sort_listing, (names,)))
+                        if first != 0: # The first frame is not the image shown so far.
+                            self.frame = None
+                if names != []:
+                    self.filelist = [prefix + name for name in names]
+                    self.number_frames = len(self.filelist)
+                    self.image_set = ImageSequence(self.filelist)
+                    if self.frame is None:
+                        self.events.put((self.set_open_progress, ("Decoding the first frame",)))
+                        with self.timer.stage("first_frame"):
+                            self.frame = self.image_set.get_data(self.index) #open each image from directory
+                        self.display_prepared = False
+                else:
+                    raise FileNotFoundError("\n\nNo suitable single-frame images found in the folder. \n")
             else:
-                self.mycanvas.destroy()
-                self.window.destroy()
-                self.haserror = True
-                raise FileNotFoundError("\n\nNo suitable single-frame images found in the folder. \n")
-        else:
-            self.mycanvas.destroy()
-            self.window.destroy()
-            self.haserror = True
-            raise RuntimeError("\n\nUnknown OS error. File or Directory may be corrupted or non-existent, and couldn't be opened. \n")
+                raise RuntimeError("\n\nUnknown OS error. File or Directory may be corrupted or non-existent, and couldn't be opened. \n")
 
+            if self.display_prepared == False:
+                self.prepare_display()
+            if self.intensity_mapper.mode == "dataset":
+                self.events.put((self.set_open_progress, ("Calibrating the display intensity",)))
+                with self.timer.stage("calibrate"):
+                    self.intensity_mapper.calibrate(self.reduce_frame(index)[0] for index in self.sample_indices())
+            # Random access into videos goes through their keyframe index once it is available (see use_keyframe_index()).
+            if os.path.isfile(self.multimedia) == True and self.isFFMPEG == True:
+                self.keyframe_index = KeyframeIndex(self.multimedia, self.image_set.get_meta_data()["fps"])
+                if self.keyframe_index.load() == True:
+                    self.use_keyframe_index()
+                else:
+                    background.append((self.build_keyframe_index, ()))
+            self.events.put((self.set_open_progress, ("Preparing the first frame",)))
+            with self.timer.stage("first_display"):
+                # The first frame is decoded already (and decoding it again would seek a video back from the calibration frames), except that
+                # JPEG files in a folder are decoded at a reduced size by reduce_frame().
+                # It is kept for build_browser(), as the frame cache drops frames larger than its budget.
+                if os.path.isdir(self.multimedia) == True and os.path.splitext(self.filelist[self.index])[1].lower() in JPEGFileExtensions:
+                    self.first_display = self.load_frame(self.index)
+                else:
+                    self.first_display = self.display_frame(*self.shrink_frame(self.frame))
+                self.frame_cache.put(self.index, self.first_display)
+            if self.listing_complete == True:
+                self.open_proxies()
+        except Exception as error:
+            self.events.put((self.open_failed, (error,)))
+            return
+        if self.stop_opening.is_set(): # The window was closed while the dataset was being opened
+            with self.reader_lock:
+                self.image_set.close()
+            return
+        self.events.put((self.build_browser, ()))
+        for target, args in background:
+            threading.Thread(target = target, args = args, daemon = True).start()
+    
+    # Work out the display size and intensity mapping from the frame just decoded (self.frame), and have it shown straight away.
+    def prepare_display(self):
         # Store the original aspect ratio to rescale the dataset (i.e. High-Res images will not fit the screen otherwise)
         self.original_height = len(self.frame[0])
         self.original_width = len(self.frame)
         self.scale_factor = np.round(self.resolution/self.original_width, 2)
-        self.update_canvas()
+        self.resize = self.scale_factor < 1
+        self.full_shape = self.frame.shape[:2] # (rows, columns)
+        self.fit_zoom = self.scale_factor if self.resize == True else 1.0
+        self.zoom = self.fit_zoom
+        # Downscale 16-bit images to 8-bit, as PIL.Image cannot open/handle 16-bit images. In "dataset" mode the intensity limits are computed here, once.
+        # Until then frames are stretched between their own min and max, which is how the first frame is shown straight away.
+        self.intensity_mapper = IntensityMapper(IntensityMode, IntensityPercentiles)
+        self.events.put((self.show_preview, (self.display_frame(*self.shrink_frame(self.frame)),)))
+        self.display_prepared = True
+    
+    # Build the widgets around the first frame, once open_dataset() has finished.
+    def build_browser(self):
+        # All widgets are built once here and updated in place afterwards, so that Tk memory and event-dispatch cost stay flat however many frames are visited.
+        # The photo and its canvas item were made by show_preview(): the calibrated first frame replaces the preview in place.
+        self.mycanvas.delete(self.open_text)
+        self.frame, self.first_display = self.first_display, None
+        self.show_frame(self.frame)
+        self.prefetcher.start()
+        self.scrub_decoder.start()
         
         # Create a box to show the XY cordinates of the mouse
+        self.xy_text = tkinter.StringVar(self.window)
+        self.myxy = tkinter.Label(self.window, textvariable = self.xy_text)
+        self.myxy.grid(row = 0, column = 2, columnspan = 1)
         self.mycanvas.bind('<Motion>', self.motion)
+        # Zoom with the mouse wheel (Button-4/5 on Linux) and pan by dragging with the right (or middle) mouse button.
+        self.mycanvas.bind('<MouseWheel>', self.on_wheel)
+        self.mycanvas.bind('<Button-4>', self.on_wheel)
+        self.mycanvas.bind('<Button-5>', self.on_wheel)
+        for button in ("2", "3"):
+            self.mycanvas.bind('<ButtonPress-' + button + '>', self.on_pan_press)
+            self.mycanvas.bind('<B' + button + '-Motion>', self.on_pan_move)
 
         # Create a button to start drawing the ROI
+        self.myROI_button = tkinter.Button(self.window, width=30, command= self.drawROI)
+        self.myROI_button['font'] = self.specialfont
+        self.myROI_button.grid(row = 3, column = 1, columnspan = 1)
         self.update_ROI()
         
         # Create a label to indicate the frame number
+        self.frame_text = tkinter.StringVar(self.window)
+        self.myframe = tkinter.Label(self.window, textvariable = self.frame_text)
+        self.myframe.grid(row = 0, column = 0, columnspan = 1)
         self.update_myframe()
         
         # Button that lets the user move forward by one frame
+        self.forward_button = tkinter.Button(self.window, text=">>", width=30, command= self.forward)
+        self.forward_button['font'] = self.largefont
+        self.forward_button.grid(row=4, column=2, columnspan=1)
         self.update_forward()
 
         # Button that lets the user move backward by one frame
+        self.backward_button = tkinter.Button(self.window, text="<<", width=30, command= self.backward)
+        self.backward_button['font'] = self.largefont
+        self.backward_button.grid(row=4, column=0, columnspan=1)
         self.update_backward()
         
         # Button that lets the user select the first and last frames of interest and create a scroll bar to scroll through frames in a dataset.
@@ -129,7 +1068,7 @@ class VideoBrowser:
                 self.sliderlength = int(np.ceil(self.photo.width()/self.number_frames))
             else:
                 self.sliderlength = 30
-            self.scrrect = tkinter.Scale(self.window, from_= 1, to = self.number_frames, orient = "horizontal", length = self.photo.width(), sliderlength = self.sliderlength, command = self.scrollrect)
+            self.scrrect = tkinter.Scale(self.window, from_= 1, to = self.number_frames, orient = "horizontal", length = self.photo.width(), sliderlength = self.sliderlength, command = self.scrollrect, state = "normal" if self.listing_complete == True else "disabled")
             self.scrrect.bind("<ButtonRelease-1>", self.scrollrect1)
             self.scrrect.grid(row = 2, column = 0, columnspan = 3)
             
@@ -140,73 +1079,494 @@ class VideoBrowser:
             self.lastframe_button = tkinter.Button(self.window, text="Single Image", width=30, state = "disabled")
         self.update_ff_lf_buttons()
         
+        # Button that looks for the frames where something happens and proposes them as the first and last frames of interest (see detect_activity())
+        if self.number_frames > 1:
+            self.suggest_button = tkinter.Button(self.window, text="Suggest Frames of Interest", width=30, command= self.suggest_frames, state = "active" if self.listing_complete == True else "disabled")
+            self.suggest_button['font'] = self.mediumfont
+            self.suggest_button.grid(row=6, column=1, columnspan=1)
+        
+        # Panel under the buttons with the mean (blue), max (red) and std (green) intensity inside the ROI for every frame. Click on it to go to a frame.
+        if self.number_frames > 1 and ShowIntensityTrace == True:
+            self.trace_width = self.photo.width()
+            self.trace_canvas = tkinter.Canvas(self.window, width = self.trace_width, height = self.trace_height, highlightthickness = 0, background = "white")
+            self.trace_canvas.grid(row = 5, column = 0, columnspan = 3)
+            self.trace_lines = [self.trace_canvas.create_line(0, 0, 0, 0, fill = colour) for colour in ("blue", "red", "green")]
+            self.trace_marker = self.trace_canvas.create_line(0, 0, 0, self.trace_height, fill = "black")
+            self.trace_label = self.trace_canvas.create_text(4, 2, anchor = tkinter.NW, text = "Draw a ROI to plot its mean (blue), max (red) and std (green) intensity")
+            self.trace_canvas.bind("<Button-1>", self.on_trace_click)
+            self.update_myframe()
+        
         # Button that lets the user safely close the image dataset
         self.exit_button = tkinter.Button(self.window, text="Continue", width=30, command= self.continue_program)
         self.exit_button['font'] = self.specialfont
         self.exit_button.grid(row=4, column=1, columnspan=1)
-        self.window.protocol("WM_DELETE_WINDOW", self.onclosingwindow)
-        self.window.mainloop()
+        self.window.bind("<F12>", self.toggle_overlay)
+        if PerformanceOverlay == True:
+            self.toggle_overlay()
+        self.open_complete = True
+        if self.timer.enabled == True:
+            self.timer.record("open", time.perf_counter()-self.opened)
+    
+    # Progress of open_dataset(), shown over the placeholder (and then over the preview) until the widgets are built.
+    def set_open_progress(self, status):
+        self.open_status = status
+        self.update_open_text()
+    
+    def update_open_text(self):
+        self.mycanvas.itemconfig(self.open_text, text = "Opening " + os.path.basename(os.path.normpath(self.multimedia)) + "\n" + self.open_status + " (%.1f s)" % (time.perf_counter()-self.opened))
+    
+    # The first frame is decoded: show it, stretched between its own min and max, while the rest of the dataset is being opened.
+    # Convert image array into TKinter compatible image. master=self.mycanvas tells Tkinter to make the photo available to mycanvas and NOT the window (which is a separate Tkinter.Tk() instance)
+    # Post the photo onto the canvas and NOT the window. Create a tag for the photo on the canvas to later handle mouse events occurring ONLY on the photo and not on other objects drawn on mycanvas (e.g. the ROI rectangle or Circle)
+    def show_preview(self, frame):
+        if self.mypic is not None: # A folder shows the first image found while it is being listed, then its first frame in natural order.
+            self.show_frame(frame)
+        else:
+            self.photo = PIL.ImageTk.PhotoImage(image = PIL.Image.fromarray(frame), master=self.mycanvas)
+            self.mycanvas.config(width = self.photo.width(), height = self.photo.height())
+            self.mypic = self.mycanvas.create_image(0, 0, image = self.photo, anchor = tkinter.NW, tags="mypic")
+            self.mycanvas.config(scrollregion=self.mycanvas.bbox('mypic'))
+            if self.timer.enabled == True:
+                self.timer.record("preview", time.perf_counter()-self.opened)
+        self.mycanvas.tag_raise(self.open_text)
+        self.mycanvas.coords(self.open_text, self.photo.width()/2, self.photo.height()/2)
+        self.mycanvas.itemconfig(self.open_text, fill = "yellow")
+    
+    # open_dataset() failed: close the window, which ends the event loop, and raise the error from the constructor (see __init__()).
+    def open_failed(self, error):
+        self.open_error = error
+        self.haserror = True
+        self.stop_filling.set()
+        self.mycanvas.destroy()
+        self.window.destroy()
     
     def onclosingwindow(self):
+        self.window.after_cancel(self.poll_id)
+        self.stop_opening.set()
+        self.stop_trace()
+        self.prefetcher.stop()
+        self.scrub_decoder.stop()
+        self.stop_filling.set()
+        self.stop_detecting.set()
+        self.timer.close()
+        if self.proxies is not None:
+            self.proxies.flush()
         self.window.destroy()
         self.haserror = True
         raise RuntimeError ("\n\nWindow closed during selection. \n")
         
+    # Run the results of background work on the Tkinter thread (Tk widgets must not be touched from other threads), every self.delay ms.
+    def poll_events(self):
+        try:
+            while True:
+                handler, args = self.events.get_nowait()
+                handler(*args)
+        except queue.Empty:
+            pass
+        if self.haserror == True: # The window was closed by open_failed()
+            return
+        if self.open_complete == False:
+            self.update_open_text()
+        if self.trace_dirty == True:
+            self.draw_trace()
+        self.polls += 1
+        if self.overlay is not None and self.polls % 25 == 0: # About once a second
+            self.update_overlay()
+        # While the dataset is being opened, its first frame and then the widgets are shown within 10 ms of being ready.
+        self.poll_id = self.window.after(self.delay if self.open_complete == True else 10, self.poll_events)
+    
+    # Number of frames of a video according to its metadata: nframes if the reader knows it, otherwise duration × fps. 0 if neither is available.
+    def estimate_frames(self):
+        meta = self.image_set.get_meta_data()
+        nframes = meta.get("nframes", float("inf"))
+        if nframes != float("inf") and nframes > 0:
+            return int(nframes)
+        return int(np.round(meta.get("duration", 0)*meta.get("fps", 0)))
+    
+    # Runs in a background thread. count_frames() starts its own ffmpeg process, so the reader itself (and the reader lock) is not involved;
+    # both the imageio reader and the KeyframeSeekReader that may have replaced it meanwhile (see use_keyframe_index()) can count.
+    def count_frames(self):
+        try:
+            with self.timer.stage("count_frames"):
+                number_frames = self.image_set.count_frames()
+        except (RuntimeError, OSError): # ffmpeg failed: keep the estimate, frames past the end are handled in update_canvas().
+            return
+        self.events.put((self.set_number_frames, (number_frames,)))
+    
+    # Runs in a background thread: the keyframe index is built by a separate ffmpeg process while the user browses with the imageio reader.
+    def build_keyframe_index(self):
+        try:
+            with self.timer.stage("keyframe_index"):
+                self.keyframe_index.build()
+        except Exception: # Without a keyframe index the imageio reader keeps serving the video.
+            return
+        self.events.put((self.use_keyframe_index, ()))
+    
+    # Swap the imageio reader of a video for a KeyframeSeekReader. Frames it decodes on its way to a requested frame go into the frame cache.
+    def use_keyframe_index(self):
+        with self.reader_lock:
+            reader = KeyframeSeekReader(self.keyframe_index, self.image_set.get_meta_data())
+            reader.on_skip = self.cache_frame
+            self.image_set.close()
+            self.image_set = reader
+    
+    # Replace the estimated number of frames by the exact one (or by a tighter upper bound if exact is False),
+    # and update the slider range and navigation buttons accordingly.
+    def set_number_frames(self, number_frames, exact = True):
+        self.frames_exact = self.frames_exact or exact
+        if number_frames == self.number_frames or number_frames < 1:
+            return
+        self.number_frames = number_frames
+        if self.index > self.number_frames-1:
+            self.index = self.number_frames-1
+            self.update_canvas()
+        if int(np.ceil(self.photo.width()/self.number_frames)) > 30:
+            self.sliderlength = int(np.ceil(self.photo.width()/self.number_frames))
+        else:
+            self.sliderlength = 30
+        self.scrrect.config(to = self.number_frames, sliderlength = self.sliderlength)
+        self.scrrect.set(self.index+1)
+        self.update_myframe()
+        self.update_forward()
+        self.update_backward()
+        self.update_trace()
+    
     def sorted_alphanumeric(self, data):
-        convert = lambda text: int(text) if text.isdigit() else text.lower()
-        alphanum_key = lambda key: [ convert(c) for c in re.split('([0-9]+)', key) ] 
-        return sorted(data, key=alphanum_key)
+        return sorted(data, key=natural_sort_key)
     
-    def update_canvas(self):
-        self.mycanvas.grid_forget()
-        if os.path.isfile(self.multimedia) == True:
-            self.frame = self.image_set.get_data(self.index) # get_data opens each frame as an image array
-        elif os.path.isdir(self.multimedia) == True:
-            self.frame = imageio.imread(self.filelist[self.index]) #open each image from directory
-
+    # Runs in a background thread: sort the names of the frames of a folder and hand the ordered file list over to the Tkinter thread.
+    def sort_listing(self, names):
+        prefix = os.path.join(self.multimedia, "")
+        with self.timer.stage("sort"):
+            filelist = [prefix + name for name in self.listing.sort(names)]
+        self.events.put((self.set_filelist, (filelist,)))
+    
+    # Replace the file list in directory order by the sorted one and enable navigation. The first frame is the same in both.
+    def set_filelist(self, filelist):
+        with self.reader_lock:
+            self.filelist = filelist
+            self.image_set.filelist = filelist
+        self.listing_complete = True
+        self.open_proxies()
+        self.scrrect.config(state = "normal")
+        self.suggest_button.config(state = "active")
+        self.update_myframe()
+        self.update_forward()
+        self.update_backward()
+        self.update_trace()
+    
+    # Decode a frame at full resolution. Readers are shared with the prefetch worker, hence the lock.
+    def read_frame(self, index):
+        with self.reader_lock, self.timer.stage("decode"):
+            return self.image_set.get_data(index) # get_data opens each frame as an image array
+    
+    # Frames used to calibrate the display intensity limits: spread evenly over the dataset, except for videos where seeking is expensive
+    # and the first consecutive frames are used instead.
+    def sample_indices(self):
+        if os.path.isfile(self.multimedia) == True and self.isFFMPEG == True:
+            return range(min(IntensitySampleFrames, self.number_frames))
+        return np.unique(np.linspace(0, self.number_frames-1, min(IntensitySampleFrames, self.number_frames)).astype(int))
+    
+    # Decode a frame and shrink it in its native dtype to roughly the display size. Returns the reduced frame and its exact display size.
+    # A background worker with a reader of its own passes it as reader, which is then used instead of the shared one.
+    def reduce_frame(self, index, reader = None):
+        shape = None
+        if self.resize == True and os.path.isdir(self.multimedia) == True and os.path.splitext(self.filelist[index])[1].lower() in JPEGFileExtensions:
+            frame, shape = self.read_draft(self.filelist[index])
+        elif reader is not None:
+            frame = reader.get_data(index)
+        else:
+            frame = self.read_frame(index)
+        return self.shrink_frame(frame, shape)
+    
+    # Shrink large frames in their native dtype before anything else: an integer stride is a zero-copy view, and it leaves at least a factor
+    # of 2 to the box filter in display_frame so the displayed frame is not aliased. Everything after this works on a fraction of the original pixels.
+    def shrink_frame(self, frame, shape = None):
+        if self.resize == True:
+            if shape is None:
+                shape = display_shape(frame.shape, self.scale_factor)
+            step = max(1, min(frame.shape[0]//shape[0], frame.shape[1]//shape[1])//2)
+            frame = frame[::step, ::step]
+        return frame, shape
+    
+    # Decode a frame and make it display-ready, unless it is in the proxy store already. Called from the Tkinter thread and from background workers.
+    def load_frame(self, index):
+        if self.proxies is not None:
+            frame = self.proxies.get(index)
+            if frame is not None:
+                return frame
+        frame = self.display_frame(*self.reduce_frame(index))
+        if self.proxies is not None:
+            self.proxies.put(index, frame)
+        return frame
+    
+    # The display-ready frame at index if it can be had without decoding (from the frame cache or the proxy store), otherwise None.
+    def ready_frame(self, index):
+        frame = self.frame_cache.get(index)
+        if frame is None and self.proxies is not None:
+            frame = self.proxies.get(index)
+        return frame
+    
+    # Proxies depend on the dataset and on everything that shapes a display-ready frame.
+    # Frames are kept at display resolution on disk as well, and filled in by a background thread with its own reader (see fill_proxies()).
+    def open_proxies(self):
+        if ProxyCacheMB > 0 and self.number_frames > 1:
+            try:
+                first = self.cached_frame(0)
+                self.proxies = ProxyStore(self.proxy_key(first.shape), self.number_frames, first.shape, ProxyCacheMB*2**20)
+            except (OSError, ValueError):
+                self.proxies = None
+            else:
+                self.proxies.put(0, first)
+                threading.Thread(target = self.fill_proxies, daemon = True).start()
+    
+    def proxy_key(self, shape):
+        settings = (self.scale_factor, shape, self.intensity_mapper.mode, self.intensity_mapper.limits, IntensityPercentiles)
+        return dataset_key(self.multimedia) + "-" + hashlib.sha1(repr(settings).encode("utf-8")).hexdigest()[:8]
+    
+    # Runs in a background thread: store every frame missing from the proxy store, in order. This thread has a reader of its own, so the
+    # reader the user is browsing with keeps its position and is never locked by this thread.
+    def fill_proxies(self):
+        reader = open_source(self.multimedia) if os.path.isfile(self.multimedia) == True else ImageSequence(self.filelist)
+        try:
+            for index in range(0, self.proxies.number_frames, self.proxies.stride):
+                if self.stop_filling.is_set():
+                    return
+                if index in self.proxies:
+                    continue
+                self.proxies.put(index, self.display_frame(*self.reduce_frame(index, reader)))
+        except Exception: # e.g. the estimated number of frames of a video overshoots. Frames that are missing are stored once they are visited.
+            pass
+        finally:
+            reader.close()
+            self.proxies.flush()
+    
+    # Store a frame that a reader decoded on its way to another one, so that stepping back to it does not need another seek.
+    def cache_frame(self, index, frame):
+        if index not in self.frame_cache:
+            frame = self.display_frame(*self.shrink_frame(frame))
+            self.frame_cache.put(index, frame)
+            if self.proxies is not None:
+                self.proxies.put(index, frame)
+    
+    # Turn a reduced frame from reduce_frame() into the 8-bit, display-sized frame shown on the canvas.
+    def display_frame(self, frame, shape):
         # Downscale 16-bit images to 8-bit, as PIL.Image cannot open/handle 16-bit images.
-        self.frame = exposure.rescale_intensity(self.frame, out_range=(0, 255)).astype('uint8')
+        with self.timer.stage("normalise"):
+            frame = self.intensity_mapper.map(frame)
         
-        # Resize the photo if needed
-        if self.scale_factor < 1:
-            self.resize = True
-            self.frame = exposure.rescale_intensity(transform.rescale(self.frame, self.scale_factor), out_range=(0, 255)).astype('uint8')
-        # Convert image array into TKinter compatible image. master=self.mycanvas tells Tkinter to make the photo available to mycanvas and NOT the window (which is a separate Tkinter.Tk() instance)
-        self.photo = PIL.ImageTk.PhotoImage(image = PIL.Image.fromarray(self.frame), master=self.mycanvas) 
-        self.mycanvas = tkinter.Canvas(self.window, width = self.photo.width(), height = self.photo.height(), highlightthickness=0)
-        # Post the photo onto the canvas and NOT the window. Create a tag for the photo on the canvas to later handle mouse events occurring ONLY on the photo and not on other objects drawn on mycanvas (e.g. the ROI rectangle or Circle)
-        self.mycanvas.create_image(0, 0, image = self.photo, anchor = tkinter.NW, tags="mypic")
-        self.mycanvas.config(scrollregion=self.mycanvas.bbox('mypic'))
-        self.mycanvas.grid(row = 1, column = 0, columnspan = 3)
+        # Resize the photo if needed. A box filter on the 8-bit frame gives exactly the display size without any float copies of the frame.
+        if self.resize == True:
+            with self.timer.stage("resize"):
+                frame = np.asarray(PIL.Image.fromarray(frame).resize((shape[1], shape[0]), PIL.Image.BOX))
+        return frame
+    
+    # Open a JPEG file at the smallest draft size that is still at least as large as the displayed frame.
+    # Returns the reduced frame and the display size computed from the full size stored in the file header.
+    def read_draft(self, filename):
+        with self.timer.stage("decode"), PIL.Image.open(filename) as image:
+            shape = display_shape((image.size[1], image.size[0]), self.scale_factor)
+            image.draft(image.mode, (shape[1], shape[0]))
+            return np.asarray(image), shape
+    
+    # Hit/miss counters of the decoded frame cache, to help tune FrameCacheMB and PrefetchFrames in ROI_Frames_Selector.cfg
+    def cache_stats(self):
+        return self.frame_cache.stats()
+    
+    def update_canvas(self):
+        with self.timer.stage("update_canvas"):
+            self.frame = self.ready_frame(self.index)
+            if self.frame is None:
+                try:
+                    self.frame = self.load_frame(self.index)
+                except IndexError:
+                    # The estimated number of frames of a video may overshoot: the last decodable frame is then the real end of the video.
+                    if self.frames_exact == True or self.index == 0:
+                        raise
+                    self.set_number_frames(self.index, exact = False)
+                    return
+                self.frame_cache.put(self.index, self.frame)
+            self.prefetcher.request(self.index, self.direction, self.number_frames)
+            if self.zoom != self.fit_zoom:
+                self.show_view()
+            else:
+                self.show_frame(self.frame)
+    
+    def show_frame(self, frame):
+        image = PIL.Image.fromarray(frame)
+        if image.size == (self.photo.width(), self.photo.height()):
+            # Copy the new pixels into the existing photo instead of creating a new PhotoImage and Canvas for every frame.
+            with self.timer.stage("photo"):
+                self.photo.paste(image)
+        else:
+            # Frames of an image sequence may differ in size: only then is a new photo needed, and it replaces the old one on the same canvas item.
+            with self.timer.stage("photo"):
+                self.photo = PIL.ImageTk.PhotoImage(image = image, master=self.mycanvas)
+            with self.timer.stage("canvas"):
+                self.mycanvas.itemconfig(self.mypic, image = self.photo)
+                self.mycanvas.config(width = self.photo.width(), height = self.photo.height(), scrollregion=self.mycanvas.bbox('mypic'))
   
+    # The display-ready frame at index, from the frame cache if possible. Runs on the scrub decoder thread.
+    def cached_frame(self, index):
+        frame = self.ready_frame(index)
+        if frame is None:
+            frame = self.load_frame(index)
+            self.frame_cache.put(index, frame)
+        return frame
+    
+    # Called from poll_events() with a frame decoded by the scrub decoder. Frames the slider has already moved past are not shown.
+    def show_scrubbed_frame(self, index, frame):
+        if index == self.index and self.zoom == self.fit_zoom:
+            self.frame = frame
+            self.show_frame(frame)
+            self.update_myframe()
+    
+    # Show the frame under the slider while it is being dragged. Cached frames are shown at once; otherwise the nearest cached frame stands in
+    # for it while the scrub decoder works on the latest slider position.
+    def scrub(self):
+        frame = self.ready_frame(self.index)
+        if self.zoom != self.fit_zoom: # Zoomed views are rendered from full-resolution frames, once the slider is released.
+            self.frame_text.set("Frame number: " + str(self.index+1) + " of " + str(self.number_frames) + " (loading)")
+        elif frame is not None:
+            self.frame = frame
+            self.show_frame(frame)
+            self.update_myframe()
+        else:
+            frame = self.frame_cache.nearest(self.index)
+            if frame is not None:
+                self.show_frame(frame)
+            self.frame_text.set("Frame number: " + str(self.index+1) + " of " + str(self.number_frames) + " (loading)")
+            self.scrub_decoder.request(self.index)
+    
+    def canvas_to_original(self, x, y):
+        return (self.view_x + x/self.zoom, self.view_y + y/self.zoom)
+    
+    def original_to_canvas(self, x, y):
+        return ((x-self.view_x)*self.zoom, (y-self.view_y)*self.zoom)
+    
+    # Zoom in or out by a factor of √2, keeping the pixel under the mouse where it is. Zooming out all the way goes back to the whole frame.
+    def on_wheel(self, event):
+        if event.num == 5 or getattr(event, "delta", 0) < 0:
+            zoom = max(self.zoom/np.sqrt(2), self.fit_zoom)
+        else:
+            zoom = min(self.zoom*np.sqrt(2), self.max_zoom)
+        if zoom < self.fit_zoom*np.sqrt(np.sqrt(2)): # Within rounding of the whole frame
+            zoom = self.fit_zoom
+        x, y = self.canvas_to_original(event.x, event.y)
+        self.zoom = zoom
+        self.set_view(x - event.x/zoom, y - event.y/zoom)
+    
+    def on_pan_press(self, event):
+        self.pan_start = (event.x, event.y, self.view_x, self.view_y)
+    
+    def on_pan_move(self, event):
+        if self.zoom != self.fit_zoom:
+            x, y, view_x, view_y = self.pan_start
+            self.set_view(view_x - (event.x-x)/self.zoom, view_y - (event.y-y)/self.zoom)
+    
+    # Move the view (kept inside the frame) and redraw the frame and the ROI.
+    def set_view(self, view_x, view_y):
+        if self.zoom == self.fit_zoom:
+            self.view_x, self.view_y = 0, 0
+            self.show_frame(self.frame)
+        else:
+            self.view_x = float(np.clip(view_x, 0, max(self.full_shape[1] - self.photo.width()/self.zoom, 0)))
+            self.view_y = float(np.clip(view_y, 0, max(self.full_shape[0] - self.photo.height()/self.zoom, 0)))
+            self.show_view()
+        if self.rect is not None and self.roi is not None:
+            self.mycanvas.coords(self.rect, *(self.original_to_canvas(*self.roi[:2]) + self.original_to_canvas(*self.roi[2:])))
+    
+    # Render the zoomed view of the current frame from the pyramid level just finer than the zoom, i.e. the frame decimated by a power of 2.
+    # Only the tiles under the canvas are cut and mapped to 8-bit, so the cost of a redraw depends on the size of the canvas, not of the frame.
+    def show_view(self):
+        width, height = self.photo.width(), self.photo.height()
+        step = 2**max(0, int(np.floor(np.log2(1/self.zoom)))) # Original pixels per pixel of the pyramid level
+        scale = self.zoom*step # Canvas pixels per pixel of the pyramid level
+        x0, y0 = self.view_x/step, self.view_y/step
+        x1, y1 = x0 + width/scale, y0 + height/scale
+        left, top = int(np.floor(x0)), int(np.floor(y0))
+        with self.timer.stage("tiles"):
+            region = self.level_region(self.index, step, top, int(np.ceil(y1)), left, int(np.ceil(x1)))
+        with self.timer.stage("normalise"):
+            image = PIL.Image.fromarray(self.intensity_mapper.map(region))
+        with self.timer.stage("resize"):
+            image = image.resize((width, height), PIL.Image.NEAREST if scale >= 2 else PIL.Image.BILINEAR, box = (x0-left, y0-top, x1-left, y1-top))
+        with self.timer.stage("photo"):
+            self.photo.paste(image)
+    
+    # Rows [top, bottom) and columns [left, right) of the pyramid level step of the frame at index, assembled from its tiles.
+    def level_region(self, index, step, top, bottom, left, right):
+        size = self.tile_size
+        region = None
+        for row in range(top//size, (bottom-1)//size+1):
+            for column in range(left//size, (right-1)//size+1):
+                tile = self.tile(index, step, row, column)
+                if region is None:
+                    region = np.zeros((bottom-top, right-left) + tile.shape[2:], dtype = tile.dtype)
+                r0, c0 = row*size-top, column*size-left # Position of the tile in the region
+                part = tile[max(-r0, 0):bottom-top-r0, max(-c0, 0):right-left-c0]
+                region[max(r0, 0):max(r0, 0)+part.shape[0], max(c0, 0):max(c0, 0)+part.shape[1]] = part
+        return region
+    
+    # A tile of the pyramid: tile_size × tile_size pixels of the frame decimated by step. Tiles are cut on first use and kept in tile_cache.
+    # Memory-mapped frames (uncompressed TIFF, .npy) only read the pixels of the tile from disk; other frames are decoded once for all their tiles.
+    def tile(self, index, step, row, column):
+        key = (index, step, row, column)
+        tile = self.tile_cache.get(key)
+        if tile is None:
+            if self.zoom_source[0] != index:
+                self.zoom_source = (index, self.read_frame(index))
+            span = self.tile_size*step
+            tile = np.array(self.zoom_source[1][row*span:(row+1)*span:step, column*span:(column+1)*span:step])
+            self.tile_cache.put(key, tile)
+        return tile
+    
+    # Show or hide the stage latencies over the frame. Timing starts the first time the overlay is shown, if it was off.
+    def toggle_overlay(self, event = None):
+        if self.overlay is None:
+            self.timer.enabled = True
+            self.overlay = self.mycanvas.create_text(4, 4, anchor = tkinter.NW, fill = "yellow", font = ("Courier", 9), text = "")
+            self.update_overlay()
+        else:
+            self.mycanvas.delete(self.overlay)
+            self.overlay = None
+    
+    def update_overlay(self):
+        lines = ["%-14s %6s %8s %8s %8s" % ("stage", "count", "p50 ms", "p90 ms", "p99 ms")]
+        percentiles = StartupTimer.percentiles()
+        percentiles.update(self.timer.percentiles())
+        for name, (count, p50, p90, p99) in sorted(percentiles.items()):
+            lines.append("%-14s %6d %8.1f %8.1f %8.1f" % (name, count, p50, p90, p99))
+        stats = self.cache_stats()
+        lines.append("frame cache: %.0f%% hits, %d frames, %.0f MB" % (100*stats["hit_rate"], stats["frames"], stats["megabytes"]))
+        self.mycanvas.itemconfig(self.overlay, text = "\n".join(lines))
+    
     def update_ROI(self):
         if self.ROIrect == False:
-            self.myROI_button = tkinter.Button(self.window, text="Click here to draw ROI", width=30, command= self.drawROI, state = "active")
-            self.myROI_button['font'] = self.specialfont
+            self.myROI_button.config(text="Click here to draw ROI", state = "active")
         else:
-            self.myROI_button = tkinter.Button(self.window, text="Reselect ROI", width=30, command= self.drawROI, state = "active")
-            self.myROI_button['font'] = self.specialfont
-        self.myROI_button.grid(row = 3, column = 1, columnspan = 1)
+            self.myROI_button.config(text="Reselect ROI", state = "active")
         
     def update_myframe(self):
-        self.myframe = tkinter.Label(self.window, text = "Frame number: " + str(self.index+1) + " of " + str(self.number_frames))
-        self.myframe.grid(row = 0, column = 0, columnspan = 1)
+        if self.listing_complete == True:
+            self.frame_text.set("Frame number: " + str(self.index+1) + " of " + str(self.number_frames))
+        else:
+            self.frame_text.set("Frame number: " + str(self.index+1) + " of " + str(self.number_frames) + " (sorting)")
+        if self.trace_canvas is not None:
+            x = (self.index+0.5)/self.number_frames*self.trace_width
+            self.trace_canvas.coords(self.trace_marker, x, 0, x, self.trace_height)
     
     def update_forward(self):
-        if self.index == self.number_frames-1:
-            self.forward_button = tkinter.Button(self.window, text=">>", width=30, state = "disabled")
+        if self.index == self.number_frames-1 or self.listing_complete == False:
+            self.forward_button.config(state = "disabled")
         else:
-            self.forward_button = tkinter.Button(self.window, text=">>", width=30, command= self.forward, state = "active")
-        self.forward_button['font'] = self.largefont
-        self.forward_button.grid(row=4, column=2, columnspan=1)
+            self.forward_button.config(state = "active")
     
     def update_backward(self):
-        if self.index == 0:
-            self.backward_button = tkinter.Button(self.window, text="<<", width=30, state = "disabled")
+        if self.index == 0 or self.listing_complete == False:
+            self.backward_button.config(state = "disabled")
         else:
-            self.backward_button = tkinter.Button(self.window, text="<<", width=30, command= self.backward, state = "active")
-        self.backward_button['font'] = self.largefont
-        self.backward_button.grid(row=4, column=0, columnspan=1)
+            self.backward_button.config(state = "active")
     
     def update_ff_lf_buttons(self):
         self.firstframe_button['font'] = self.mediumfont
@@ -216,100 +1576,142 @@ class VideoBrowser:
 
     def forward(self):
         self.index += 1
+        self.direction = 1
         if self.index <= self.number_frames-1:
-            self.myROI_button.grid_forget()
-            
             self.update_myframe()
             self.update_canvas()
             self.update_forward()
             self.update_backward()
             self.update_ROI()
             self.scrrect.set(self.index+1)
-            self.scrrect.grid(row = 2, column = 0, columnspan = 3)
-            # Create a box to show the XY cordinates of the mouse
-            self.mycanvas.bind('<Motion>', self.motion)
            
     def backward(self):
         self.index -= 1
+        self.direction = -1
         if self.index >= 0:
-            self.myROI_button.grid_forget()
-            
             self.update_myframe()            
             self.update_canvas()
             self.update_forward()
             self.update_backward()
             self.update_ROI()
             self.scrrect.set(self.index+1)
-            self.scrrect.grid(row = 2, column = 0, columnspan = 3)
-            # Create a box to show the XY cordinates of the mouse
-            self.mycanvas.bind('<Motion>', self.motion)
             
     def scrollrect(self, val):
+        if int(val)-1 == self.index: # The slider was moved by forward(), backward() or set_number_frames().
+            return
+        self.direction = 1 if int(val)-1 > self.index else -1
         self.index = int(val)-1
-        #self.scrrect.grid(row = 2, column = 0, columnspan = 3)
+        self.scrub()
     def scrollrect1(self, evnt):
         self.update_myframe()
         self.update_canvas()
         self.update_forward()
         self.update_backward()
-        self.mycanvas.bind('<Motion>', self.motion)
     
     def firstframe(self):
         self.first_frame = self.index
-        self.firstframe_button.grid_forget()
-        self.lastframe_button.grid_forget()
-        self.myROI_button.grid_forget()
-        
         if self.last_frame == None:
-            self.firstframe_button = tkinter.Button(self.window, text="First Frame: " + str(self.first_frame+1), width=30, command= self.firstframe, state = "active")
-            self.lastframe_button = tkinter.Button(self.window, text="Select Last Frame", width=30, command= self.lastframe, state = "active")
+            self.firstframe_button.config(text="First Frame: " + str(self.first_frame+1), state = "active")
+            self.lastframe_button.config(text="Select Last Frame", state = "active")
         elif self.first_frame >= self.last_frame and self.last_frame != None:
-            self.firstframe_button = tkinter.Button(self.window, text="Frame Index Out of Range ("+str(self.first_frame+1)+")", width=30, command= self.firstframe, state = "disabled")
-            self.lastframe_button = tkinter.Button(self.window, text="Last Frame: " + str(self.last_frame+1), width=30, command= self.lastframe, state = "active")
+            self.firstframe_button.config(text="Frame Index Out of Range ("+str(self.first_frame+1)+")", state = "disabled")
+            self.lastframe_button.config(text="Last Frame: " + str(self.last_frame+1), state = "active")
         else:
-            self.firstframe_button = tkinter.Button(self.window, text="First Frame: " + str(self.first_frame+1), width=30, command= self.firstframe, state = "active")
-            self.lastframe_button = tkinter.Button(self.window, text="Last Frame: " + str(self.last_frame+1), width=30, command= self.lastframe, state = "active")
-        self.update_ff_lf_buttons()
+            self.firstframe_button.config(text="First Frame: " + str(self.first_frame+1), state = "active")
+            self.lastframe_button.config(text="Last Frame: " + str(self.last_frame+1), state = "active")
         self.update_ROI()
-        
-        # Create a box to show the XY cordinates of the mouse
-        self.mycanvas.bind('<Motion>', self.motion)
     
     def lastframe(self):
         self.last_frame = self.index
-        self.firstframe_button.grid_forget()
-        self.lastframe_button.grid_forget()
-        self.myROI_button.grid_forget()
-        
         if self.first_frame == None:
-            self.lastframe_button = tkinter.Button(self.window, text="Last Frame: " + str(self.last_frame+1), width=30, command= self.lastframe, state = "active")
-            self.firstframe_button = tkinter.Button(self.window, text="Select First Frame", width=30, command= self.firstframe, state = "active")
+            self.lastframe_button.config(text="Last Frame: " + str(self.last_frame+1), state = "active")
+            self.firstframe_button.config(text="Select First Frame", state = "active")
         elif self.last_frame <= self.first_frame and self.first_frame != None:
-            self.lastframe_button = tkinter.Button(self.window, text="Frame Index Out of Range ("+str(self.last_frame+1)+")", width=30, command= self.lastframe, state = "disabled")
-            self.firstframe_button = tkinter.Button(self.window, text="First Frame: " + str(self.first_frame+1), width=30, command= self.firstframe, state = "active")
+            self.lastframe_button.config(text="Frame Index Out of Range ("+str(self.last_frame+1)+")", state = "disabled")
+            self.firstframe_button.config(text="First Frame: " + str(self.first_frame+1), state = "active")
         else:
-            self.lastframe_button = tkinter.Button(self.window, text="Last Frame: " + str(self.last_frame+1), width=30, command= self.lastframe, state = "active")
-            self.firstframe_button = tkinter.Button(self.window, text="First Frame: " + str(self.first_frame+1), width=30, command= self.firstframe, state = "active")
-        self.update_ff_lf_buttons()
+            self.lastframe_button.config(text="Last Frame: " + str(self.last_frame+1), state = "active")
+            self.firstframe_button.config(text="First Frame: " + str(self.first_frame+1), state = "active")
+        self.update_ROI()
+    
+    def suggest_frames(self):
+        self.suggest_button.config(text="Looking for activity...", state = "disabled")
+        threading.Thread(target = self.detect_activity, daemon = True).start()
+    
+    # Runs in a background thread: stream the dataset once at low resolution, measure how much every frame differs from the one before it and
+    # suggest the frames that stand out (see suggest_frame_range()). Frames already in the proxy store are not decoded again, and frames of
+    # other datasets that are decoded here are added to it. Videos whose proxies are not complete are streamed by ffmpeg, scaled down and in grey.
+    def detect_activity(self):
+        batch_frames = 256
+        energy = []
+        previous = None
+        batch = []
+        try:
+            if os.path.isfile(self.multimedia) == True and self.isFFMPEG == True and (self.proxies is None or self.proxies.complete() == False):
+                import imageio_ffmpeg
+                width = 128
+                height = 2*max(1, int(np.round(width*self.original_width/self.original_height/2))) # original_width is the number of rows
+                frames = (np.frombuffer(data, dtype = np.uint8).reshape(height, width) for data in
+                          itertools.islice(imageio_ffmpeg.read_frames(self.multimedia, pix_fmt = "gray", bpp = 1, output_params = ["-s", "%dx%d" % (width, height)]), 1, None))
+            else:
+                frames = (self.activity_frame(index) for index in range(self.number_frames))
+            for frame in frames:
+                if self.stop_detecting.is_set():
+                    return
+                batch.append(frame)
+                if len(batch) == batch_frames:
+                    energy.append(difference_energy(np.asarray(batch, dtype = np.float32), previous))
+                    previous = np.asarray(batch[-1], dtype = np.float32)
+                    batch = []
+                    self.events.put((self.set_activity_progress, (sum(len(chunk) for chunk in energy),)))
+            if batch != []:
+                energy.append(difference_energy(np.asarray(batch, dtype = np.float32), previous))
+        except Exception: # e.g. a frame that cannot be decoded: suggest from the frames read so far.
+            pass
+        suggestion = suggest_frame_range(np.concatenate(energy), ActivityThreshold) if energy != [] else None
+        self.events.put((self.set_suggestion, (suggestion,)))
+    
+    # Grey, low-resolution version of the display frame at index, from the proxy store if possible.
+    def activity_frame(self, index):
+        frame = self.proxies.get(index) if self.proxies is not None else None
+        if frame is None:
+            frame = self.display_frame(*self.reduce_frame(index))
+            if self.proxies is not None:
+                self.proxies.put(index, frame)
+        step = max(1, max(frame.shape[:2])//128)
+        frame = frame[::step, ::step]
+        return frame.mean(axis = 2) if frame.ndim == 3 else frame
+    
+    def set_activity_progress(self, number_frames):
+        self.suggest_button.config(text="Looking for activity... " + str(int(100*number_frames/self.number_frames)) + "%")
+    
+    def set_suggestion(self, suggestion):
+        self.suggestion = suggestion
+        if suggestion is None:
+            self.suggest_button.config(text="No Distinct Activity Found", state = "disabled")
+        else:
+            self.suggest_button.config(text="Use Frames " + str(suggestion[0]+1) + " to " + str(suggestion[1]+1), state = "active", command = self.accept_suggestion)
+    
+    # Take the suggested frames as the frames of interest and go to the first one.
+    def accept_suggestion(self):
+        self.first_frame, self.last_frame = self.suggestion
+        self.firstframe_button.config(text="First Frame: " + str(self.first_frame+1), state = "active")
+        self.lastframe_button.config(text="Last Frame: " + str(self.last_frame+1), state = "active")
+        self.direction = 1 if self.first_frame > self.index else -1
+        self.index = self.first_frame
+        self.scrrect.set(self.index+1)
+        self.scrollrect1(None)
         self.update_ROI()
-        
-        # Create a box to show the XY cordinates of the mouse
-        self.mycanvas.bind('<Motion>', self.motion)
     
     def drawROI(self):
-        #If to re-draw the rectangle or circle, delete all previous objects on mycanvas and start afresh.
-        if self.ROIrect == True:
-            self.mycanvas.delete('all')
+        #If to re-draw the rectangle or circle, delete the previous one from mycanvas and start afresh. The photo itself stays on the canvas.
+        if self.rect != None:
+            self.mycanvas.delete(self.rect)
             self.rect = None
-            self.update_canvas()
             
-        self.myROI_button.grid_forget()
-        self.myROI_button = tkinter.Button(self.window, text="Selecting...", width=30, state = "disabled")
-        self.myROI_button['font'] = self.specialfont
-        self.myROI_button.grid(row = 3, column = 1, columnspan = 1)
+        self.myROI_button.config(text="Selecting...", state = "disabled")
         self.ROIrect = True        
 
-        self.mycanvas.bind('<Motion>', self.motion)
         self.mycanvas.bind("<ButtonPress-1>", self.on_button_press)
         self.mycanvas.bind("<B1-Motion>", self.on_move_press)
         self.mycanvas.bind("<ButtonRelease-1>", self.on_button_release)
@@ -317,11 +1719,8 @@ class VideoBrowser:
     # Shows the cursor coordinates on the photo on mycanvas.    
     def motion(self, event):
         self.x, self.y = event.x, event.y
-        if self.resize == False:
-            self.myxy = tkinter.Label(self.window, text = "XY coordinates: " + str(self.x) + ", " + str(self.y))
-        else:
-            self.myxy = tkinter.Label(self.window, text = "XY coordinates: " + str(np.round(self.x/self.scale_factor)) + ", " + str(np.round(self.y/self.scale_factor)))
-        self.myxy.grid(row = 0, column = 2, columnspan = 1)
+        x, y = self.canvas_to_original(self.x, self.y)
+        self.xy_text.set("XY coordinates: " + str(int(x)) + ", " + str(int(y)))
     
     # Create a rectangle or a circle on left-mouse click ONLY if there are no other rectangles or circles already present.
     def on_button_press(self, event1):
@@ -329,6 +1728,7 @@ class VideoBrowser:
             # save mouse drag start position
             self.start_x = event1.x
             self.start_y = event1.y
+            self.roi = self.canvas_to_original(self.start_x, self.start_y)*2
             if self.ROIshape == 0:
                 self.rect = self.mycanvas.create_rectangle(self.x, self.y, self.x+1, self.y+1, outline='red')
             else:
@@ -341,17 +1741,98 @@ class VideoBrowser:
             self.curY = event2.y
             # expand rectangle/circle as you drag the mouse
             self.mycanvas.coords(self.rect, self.start_x, self.start_y, self.curX, self.curY)
-            if self.resize == False:
-                self.myxy = tkinter.Label(self.window, text = "XY coordinates: " + str(self.curX) + ", " + str(self.curY))
-            else:
-                self.myxy = tkinter.Label(self.window, text = "XY coordinates: " + str(np.round(self.curX/self.scale_factor)) + ", " + str(np.round(self.curY/self.scale_factor)))
-            self.myxy.grid(row = 0, column = 2, columnspan = 1)
+            x, y = self.canvas_to_original(self.curX, self.curY)
+            self.roi = self.roi[:2] + (x, y)
+            self.xy_text.set("XY coordinates: " + str(int(x)) + ", " + str(int(y)))
 
     def on_button_release(self, event3):
-        self.myROI_button.grid_forget()
-        self.update_ROI()        
+        self.update_ROI()
+        self.update_trace()
+    
+    # ROI in original pixel coordinates (X1, Y1, X2, Y2), rounded and clipped to the frame.
+    def roi_box(self):
+        xs = np.clip(np.round([self.roi[0], self.roi[2]]), 0, self.full_shape[1])
+        ys = np.clip(np.round([self.roi[1], self.roi[3]]), 0, self.full_shape[0])
+        return (int(min(xs)), int(min(ys)), int(max(xs)), int(max(ys)))
+    
+    # Start computing the intensity trace of the current ROI. Chunks of frames go to a pool of worker threads, and every chunk that comes
+    # back is drawn straight away. Chunks already computed for the same ROI (see IntensityTrace) are not sent again.
+    def update_trace(self):
+        if self.trace_canvas is None or self.listing_complete == False or None in (self.start_x, self.start_y, self.curX, self.curY):
+            return
+        box = self.roi_box()
+        if box[0] == box[2] or box[1] == box[3]:
+            return
+        for future in self.trace_futures:
+            future.cancel()
+        key = (box, self.ROIshape, self.number_frames)
+        if key not in self.traces:
+            self.traces[key] = IntensityTrace(dataset_key(self.multimedia) + "-" + hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:8], self.number_frames)
+        self.trace = self.traces[key]
+        if self.trace_pool is None:
+            # Threads rather than processes: forking a process that runs Tk can deadlock the workers, and spawning them would re-import the calling
+            # script, which needs an if __name__ == "__main__" guard. Decoding and the NumPy reductions release the GIL. One CPU is left for the user interface.
+            self.trace_pool = concurrent.futures.ThreadPoolExecutor(max_workers = max(1, (os.cpu_count() or 2)-1))
+        self.trace_futures = []
+        for start in self.trace.missing(self.trace_chunk_frames):
+            stop = min(start+self.trace_chunk_frames, self.number_frames)
+            source = self.filelist[start:stop] if os.path.isdir(self.multimedia) == True else self.multimedia
+            future = self.trace_pool.submit(trace_chunk, source, start, stop, box, self.ROIshape)
+            future.add_done_callback(lambda future, trace = self.trace, start = start: self.events.put((self.set_trace_chunk, (trace, start, future))))
+            self.trace_futures.append(future)
+        self.trace_dirty = True
+    
+    # Called from poll_events() for every chunk of the trace that a worker has finished (or that was cancelled because the ROI changed).
+    def set_trace_chunk(self, trace, start, future):
+        if future.cancelled() == True or future.exception() is not None: # e.g. the estimated number of frames of a video overshoots
+            return
+        trace.put(start, future.result())
+        if trace is self.trace:
+            self.trace_dirty = True
+            if all(future.done() for future in self.trace_futures):
+                trace.save()
+    
+    # Plot the trace with one point per pixel column of the panel: mean and std are averaged and max is maximised over the frames of each column.
+    def draw_trace(self):
+        self.trace_dirty = False
+        values = self.trace.values[:self.number_frames]
+        known = ~np.isnan(values[:, 0])
+        self.trace_canvas.itemconfig(self.trace_label, text = "ROI mean (blue), max (red), std (green): " + str(int(known.sum())) + " of " + str(len(values)) + " frames")
+        starts = np.unique(np.linspace(0, len(values), self.trace_width, endpoint = False).astype(int))
+        counts = np.add.reduceat(known, starts)
+        sums = np.add.reduceat(np.where(known[:, None], values, 0), starts, axis = 0)
+        columns = np.divide(sums, counts[:, None], out = np.full(sums.shape, np.nan), where = counts[:, None] > 0)
+        columns[:, 1] = np.fmax.reduceat(values[:, 1], starts)
+        x = starts/len(values)*self.trace_width
+        for series, line in zip(columns.T, self.trace_lines):
+            valid = ~np.isnan(series)
+            if valid.sum() < 2:
+                self.trace_canvas.coords(line, 0, 0, 0, 0)
+                continue
+            low, high = series[valid].min(), series[valid].max()
+            y = self.trace_height-2 - (series[valid]-low)/((high-low) or 1)*(self.trace_height-18)
+            self.trace_canvas.coords(line, *np.column_stack((x[valid], y)).ravel().tolist())
+    
+    def on_trace_click(self, event):
+        if self.listing_complete == False:
+            return
+        index = int(np.clip(event.x/self.trace_width*self.number_frames, 0, self.number_frames-1))
+        self.direction = 1 if index > self.index else -1
+        self.index = index
+        self.scrrect.set(self.index+1)
+        self.scrollrect1(event)
+    
+    # Stop the worker threads and keep what has been computed of every trace for the next time.
+    def stop_trace(self):
+        if self.trace_pool is not None:
+            self.trace_pool.shutdown(wait = False, cancel_futures = True)
+            self.trace_pool = None
+        for trace in self.traces.values():
+            trace.save()
     
     def results(self):
+        if self.open_complete == False: # The window was closed while the dataset was being opened: nothing was selected.
+            return (None, None, None, None, None, None, True)
         if self.start_x != None and self.start_y != None and self.curX != None and self.curY != None:
             if self.number_frames > 1:
                 return (self.first_frame, self.last_frame, np.minimum(self.start_x, self.curX), np.minimum(self.start_y, self.curY), np.maximum(self.start_x, self.curX), np.maximum(self.start_y, self.curY), self.haserror)
@@ -375,28 +1856,8 @@ class VideoBrowser:
             else:
                 print("Last Frame Index: ", self.last_frame)
         if self.start_x != None and self.start_y != None and self.curX != None and self.curY != None:
-            if self.start_x < 0:
-                self.start_x = 0
-            elif self.start_x > self.photo.width():
-                self.start_x = self.photo.width()
-            if self.start_y < 0:
-                self.start_y = 0
-            elif self.start_y > self.photo.height():
-                self.start_y = self.photo.height()
-            if self.curX < 0:
-                self.curX = 0
-            elif self.curX > self.photo.width():
-                self.curX = self.photo.width()
-            if self.curY < 0:
-                self.curY = 0
-            elif self.curY > self.photo.height():
-                self.curY = self.photo.height()
-            
-            if self.resize == True:
-                self.start_x = int(np.round(self.start_x/self.scale_factor))
-                self.start_y = int(np.round(self.start_y/self.scale_factor))
-                self.curX = int(np.round(self.curX/self.scale_factor))
-                self.curY = int(np.round(self.curY/self.scale_factor))
+            # The ROI was recorded in original pixel coordinates as it was drawn, so it is exact whatever the zoom it was drawn at.
+            self.start_x, self.start_y, self.curX, self.curY = self.roi_box()
             if self.ROIshape == 0:
                 print("ROI Rectangle ( X1, Y1, X2, Y2 ): (", np.minimum(self.start_x, self.curX), ",", np.minimum(self.start_y, self.curY), ",", np.maximum(self.start_x, self.curX), ",", np.maximum(self.start_y, self.curY), ")")
             else:
@@ -404,7 +1865,16 @@ class VideoBrowser:
         else:
             print("ROI not selected. 'None' type will be returned!")
         print()
-        if os.path.isfile(self.multimedia) == True:
+        self.window.after_cancel(self.poll_id)
+        self.stop_trace()
+        self.prefetcher.stop()
+        self.scrub_decoder.stop()
+        self.stop_filling.set()
+        self.stop_detecting.set()
+        self.timer.close()
+        if self.proxies is not None:
+            self.proxies.flush()
+        with self.reader_lock:
             self.image_set.close()
         self.mycanvas.destroy()
         self.firstframe_button.destroy()
@@ -446,8 +1916,17 @@ class FileSelector:
         self.frame4['font'] = font.Font(family="Helvetica", size=10, weight=font.BOLD, slant=font.ITALIC)
         self.frame4.grid(row = 4, column = 1, columnspan = 1)
         self.root.protocol("WM_DELETE_WINDOW", self.onclosingroot)
+        self.root.after_idle(self.window_shown) # Idle callbacks run once Tk has drawn the window
         self.root.mainloop()
     
+    # The file selector is on screen: record the time to first window and import the imaging modules while the user picks a file.
+    def window_shown(self):
+        if StartupTimer.enabled == True:
+            first_window = time.perf_counter()-ImportStarted
+            StartupTimer.record("first_window", first_window)
+            print("File selector shown %.0f ms after the start of the import." % (first_window*1000))
+        warm_up()
+    
     def onclosingroot(self):
         self.root.destroy()
         raise RuntimeError ("\n\nWindow closed during selection. \n")
@@ -482,6 +1961,281 @@ class FileSelector:
     def results(self):
         return self.myresults
 
+class BatchAnnotator:
+    # Shows a list of datasets one after the other and appends the results of each to a CSV or JSON file (by its extension) as soon as
+    # "Continue" is pressed. An interrupted batch loses nothing and is resumed by running it again: datasets already in the file are skipped,
+    # except those recorded with haserror set, which are tried again (a new record is appended for them).
+    # While the operator works on one dataset, the next one is opened in the background (see VideoBrowser.preload()), so it shows without a wait.
+    Fields = ("dataset", "first_frame", "last_frame", "x1", "y1", "x2", "y2", "roi_shape", "haserror")
+    
+    def __init__(self, datasets, output, ROIshape = 0):
+        if int(ROIshape) != 0 and int(ROIshape) != 1:
+            raise ValueError("\n\nROIshape must be 0 for rectangle and 1 for circle. \n")
+        self.ROIshape = int(ROIshape)
+        self.output = output
+        self.records = self.load()
+        # haserror is the string "False" in a CSV file and the boolean False in a JSON file.
+        done = set(record["dataset"] for record in self.records if str(record["haserror"]) == "False")
+        self.datasets = [dataset for dataset in datasets if os.path.abspath(dataset) not in done]
+        if len(self.datasets) < len(datasets):
+            print(str(len(datasets)-len(self.datasets)) + " of " + str(len(datasets)) + " datasets are done in " + output + " already and are skipped.")
+    
+    # Records written to the output by earlier runs, as lists of strings (CSV) or dictionaries (JSON), keyed by field name.
+    def load(self):
+        if os.path.exists(self.output) == False:
+            return []
+        with open(self.output, newline = "") as file:
+            if self.output.lower().endswith(".json") == True:
+                return json.load(file)
+            return list(csv.DictReader(file))
+    
+    # Append the results() of one dataset to the output. CSV files get one more line; JSON files are rewritten whole (through a temporary
+    # file, so that an interruption cannot leave a truncated file) since a JSON list cannot be appended to.
+    def append(self, dataset, results):
+        values = [None]*6 + [results[-1]] # first_frame, last_frame, x1, y1, x2, y2, haserror
+        if len(results) == 7:
+            values = list(results)
+        elif len(results) == 5: # Single images have no frames of interest
+            values[2:] = list(results)
+        values = [int(value) if value is not None and not isinstance(value, bool) else value for value in values]
+        record = dict(zip(BatchAnnotator.Fields, [os.path.abspath(dataset)] + values[:6] + [self.ROIshape, values[6]]))
+        self.records.append(record)
+        if self.output.lower().endswith(".json") == True:
+            with open(self.output + ".tmp", "w") as file:
+                json.dump(self.records, file, indent = 1)
+            os.replace(self.output + ".tmp", self.output)
+        else:
+            new = os.path.exists(self.output) == False or os.path.getsize(self.output) == 0
+            with open(self.output, "a", newline = "") as file:
+                writer = csv.DictWriter(file, fieldnames = BatchAnnotator.Fields)
+                if new == True:
+                    writer.writeheader()
+                writer.writerow({key: "" if value is None else value for key, value in record.items()})
+    
+    # Show every dataset in turn. Closing a window ends the batch (the dataset shown then is not recorded); a dataset that cannot be opened
+    # is recorded with haserror set and the batch goes on. Returns all the records in the output.
+    def run(self):
+        following = VideoBrowser.preload(self.datasets[0], self.ROIshape) if self.datasets != [] else None
+        for position, dataset in enumerate(self.datasets):
+            browser = following
+            following = VideoBrowser.preload(self.datasets[position+1], self.ROIshape) if position+1 < len(self.datasets) else None
+            print("Dataset " + str(position+1) + " of " + str(len(self.datasets)) + ": " + dataset)
+            try:
+                browser.show(tkinter.Tk())
+            except Exception as error:
+                if error is not browser.open_error:
+                    raise
+                print(str(error).strip()) # open_dataset() failed
+                self.append(dataset, (True,))
+                continue
+            if browser.haserror == True: # Window closed during selection
+                if following is not None:
+                    following.discard()
+                print("Batch stopped. Run it again to resume from " + dataset)
+                break
+            self.append(dataset, browser.results())
+        return self.records
+
+# Pixels of a w × h box that are inside the ellipse inscribed in it, i.e. the circle (or ellipse) drawn by VideoBrowser when ROIshape is 1.
+def ellipse_mask(height, width):
+    rows, columns = np.ogrid[:height, :width]
+    return ((rows+0.5-height/2)/(height/2))**2 + ((columns+0.5-width/2)/(width/2))**2 <= 1
+
+# Readers opened by the current worker (a process of ROIExtractor or a thread of the trace pool), kept between chunks so that a worker given
+# consecutive chunks of a video keeps decoding forward. Each thread has its own readers, which are closed when the thread exits.
+WorkerReaders = threading.local()
+
+def worker_reader(multimedia):
+    if hasattr(WorkerReaders, "readers") == False:
+        WorkerReaders.readers = {}
+    if multimedia not in WorkerReaders.readers:
+        reader = open_source(multimedia)
+        if os.path.splitext(multimedia)[1].lower() in FFMPEGFileExtensions:
+            meta = reader.get_meta_data()
+            keyframe_index = KeyframeIndex(multimedia, meta["fps"])
+            if keyframe_index.load() == True: # Seek through the keyframe index saved by VideoBrowser, if the video has been opened before.
+                reader.close()
+                reader = KeyframeSeekReader(keyframe_index, meta)
+        WorkerReaders.readers[multimedia] = reader
+    return WorkerReaders.readers[multimedia]
+
+# Runs in a worker (a process of ROIExtractor or a thread of the trace pool): decode the frames [start, stop) of a file, or the files of a folder given as a list, and crop them to the ROI.
+# The cropped frames are returned as one array, or written to the folder output_directory (one TIFF file per frame) if it is given.
+def extract_chunk(source, start, stop, box, ROIshape, output_directory = None):
+    if isinstance(source, list):
+        reader, positions = ImageSequence(source), range(len(source))
+    else:
+        reader, positions = worker_reader(source), range(start, stop)
+    x1, y1, x2, y2 = box
+    frames = []
+    for position in positions:
+        frame = np.array(reader.get_data(position)[y1:y2, x1:x2]) # Copy: frames may be read-only views of a memory-mapped file.
+        if ROIshape == 1:
+            frame[~ellipse_mask(*frame.shape[:2])] = 0
+        frames.append(frame)
+    if output_directory is not None:
+        for index, frame in zip(range(start, stop), frames):
+            imageio.imwrite(os.path.join(output_directory, "frame_%06d.tif" % index), frame)
+        return len(frames)
+    return np.stack(frames)
+
+# Runs in a worker thread: mean, maximum and standard deviation of the pixels inside the ROI for the frames [start, stop), one row per frame.
+def trace_chunk(source, start, stop, box, ROIshape):
+    frames = extract_chunk(source, start, stop, box, 0)
+    if ROIshape == 1:
+        values = frames[:, ellipse_mask(*frames.shape[1:3])]
+    else:
+        values = frames
+    values = values.reshape(len(frames), -1)
+    return np.stack((values.mean(axis = 1, dtype = np.float64), values.max(axis = 1).astype(np.float64), values.std(axis = 1, dtype = np.float64)), axis = 1)
+
+class ROIExtractor:
+    # Headless extraction of the ROI over the frame range selected with VideoBrowser or FileSelector. results is the tuple returned by
+    # results() (with None for anything not selected, meaning the whole frame or the whole dataset), and ROIshape the shape it was drawn with.
+    # Frames are decoded and cropped in chunks by a pool of worker processes and written in order as they come back. At most two chunks per
+    # worker are in flight, so memory stays bounded however long the frame range is.
+    def __init__(self, multimedia, results, ROIshape = 0, workers = None, chunk_frames = 64):
+        self.multimedia = multimedia
+        if int(ROIshape) != 0 and int(ROIshape) != 1:
+            raise ValueError("\n\nROIshape must be 0 for rectangle and 1 for circle. \n")
+        self.ROIshape = int(ROIshape)
+        if results is None or results[-1] == True:
+            raise ValueError("\n\nThe selection ended with an error, there is nothing to extract. \n")
+        if len(results) == 7:
+            self.first_frame, self.last_frame, self.box = results[0], results[1], results[2:6]
+        elif len(results) == 5:
+            self.first_frame, self.last_frame, self.box = 0, 0, results[0:4]
+        else:
+            raise ValueError("\n\nresults must be the tuple returned by VideoBrowser.results(). \n")
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_frames = chunk_frames
+        
+        # Frames of a folder are listed (and sorted) once here; workers are given the files of their chunk.
+        if os.path.isdir(multimedia) == True:
+            listing = FolderListing(multimedia)
+            names = listing.load()
+            if names is None:
+                names = listing.sort(listing.scan())
+            if names == []:
+                raise FileNotFoundError("\n\nNo suitable single-frame images found in the folder. \n")
+            self.filelist = [os.path.join(multimedia, name) for name in names]
+            self.number_frames = len(self.filelist)
+            first = ImageSequence(self.filelist).get_data(0)
+        elif os.path.isfile(multimedia) == True:
+            self.filelist = None
+            reader = open_source(multimedia)
+            try:
+                if self.last_frame is None and os.path.splitext(multimedia)[1].lower() in FFMPEGFileExtensions:
+                    self.number_frames = reader.count_frames()
+                else:
+                    self.number_frames = reader.get_length()
+                first = reader.get_data(0)
+            finally:
+                reader.close()
+        else:
+            raise FileNotFoundError("\n\nFile or Directory may be corrupted or non-existent, and couldn't be opened. \n")
+        
+        if self.first_frame is None:
+            self.first_frame = 0
+        if self.last_frame is None:
+            self.last_frame = self.number_frames-1
+        if self.first_frame > self.last_frame:
+            raise ValueError("\n\nThe first frame of interest is after the last frame of interest. \n")
+        if self.first_frame < 0 or self.last_frame > self.number_frames-1:
+            raise ValueError("\n\nThe frames of interest are outside the dataset. \n")
+        # ROI coordinates from VideoBrowser are clipped to the frame; a missing ROI means the whole frame.
+        if None in self.box:
+            self.box = (0, 0, first.shape[1], first.shape[0])
+        x1, y1, x2, y2 = (int(value) for value in self.box)
+        self.box = (max(min(x1, x2), 0), max(min(y1, y2), 0), min(max(x1, x2), first.shape[1]), min(max(y1, y2), first.shape[0]))
+        if self.box[0] >= self.box[2] or self.box[1] >= self.box[3]:
+            raise ValueError("\n\nThe ROI is empty. \n")
+    
+    # Extract the ROI of every frame from first_frame to last_frame (inclusive) into output: a multi-page TIFF file (.tif, .tiff),
+    # a .npy file (written through a memory map) or, for any other path, a folder of TIFF files named after the frame index. Returns output.
+    def run(self, output):
+        extension = os.path.splitext(output)[1].lower()
+        self.output_directory = None
+        self.writer = None # TiffWriter, or memory-mapped .npy array created once the size of the cropped frames is known
+        if extension in (".tif", ".tiff"):
+            if installed("tifffile") == False:
+                raise RuntimeError("\n\nWriting TIFF stacks needs tifffile (pip install tifffile). \n")
+            self.writer = tifffile.TiffWriter(output, bigtiff = True)
+        elif extension != ".npy":
+            self.output_directory = output
+            os.makedirs(self.output_directory, exist_ok = True)
+        self.written = 0
+        
+        pending = collections.deque()
+        with concurrent.futures.ProcessPoolExecutor(max_workers = self.workers) as pool:
+            try:
+                for start in range(self.first_frame, self.last_frame+1, self.chunk_frames):
+                    stop = min(start+self.chunk_frames, self.last_frame+1)
+                    source = self.filelist[start:stop] if self.filelist is not None else self.multimedia
+                    pending.append(pool.submit(extract_chunk, source, start, stop, self.box, self.ROIshape, self.output_directory))
+                    if len(pending) == 2*self.workers:
+                        self.write_chunk(output, pending.popleft().result())
+                while len(pending) > 0:
+                    self.write_chunk(output, pending.popleft().result())
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+            finally:
+                if isinstance(self.writer, np.memmap):
+                    self.writer.flush()
+                elif self.writer is not None:
+                    self.writer.close()
+                self.writer = None
+        return output
+    
+    # Write the frames of a chunk after the ones already written. Workers write folder outputs themselves and only return how many frames they wrote.
+    def write_chunk(self, output, frames):
+        if self.output_directory is not None:
+            self.written += frames
+            return
+        if self.writer is None:
+            self.writer = np.lib.format.open_memmap(output, mode = "w+", dtype = frames.dtype, shape = (self.last_frame-self.first_frame+1,) + frames.shape[1:])
+        if isinstance(self.writer, np.memmap):
+            self.writer[self.written:self.written+len(frames)] = frames
+        else:
+            for frame in frames:
+                self.writer.write(frame, contiguous = True)
+        self.written += len(frames)
+
+# Command line: without arguments the file selector opens. With --extract, the ROI and frame range given (the values printed by
+# continue_program()) are extracted without opening any window.
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description = "Select a ROI and frames of interest, or extract them from a dataset.")
+    parser.add_argument("--extract", nargs = 2, metavar = ("MULTIMEDIA", "OUTPUT"), help = "extract the ROI from a file or folder into a .tif stack, a .npy file or a folder of TIFF files")
+    parser.add_argument("--frames", nargs = 2, type = int, metavar = ("FIRST", "LAST"), help = "first and last frame index of interest (default: all frames)")
+    parser.add_argument("--roi", nargs = 4, type = int, metavar = ("X1", "Y1", "X2", "Y2"), help = "ROI rectangle, or bounding box of the ROI circle (default: whole frame)")
+    parser.add_argument("--shape", type = int, default = 0, choices = (0, 1), help = "0 for a rectangle (default), 1 for a circle")
+    parser.add_argument("--workers", type = int, default = None, help = "number of worker processes (default: number of CPUs)")
+    parser.add_argument("--batch", nargs = "*", metavar = "DATASET", help = "files, folders or glob patterns of the datasets to annotate one after the other")
+    parser.add_argument("--list", metavar = "FILE", help = "text file with more datasets for --batch, one per line (implies --batch)")
+    parser.add_argument("--results", default = "ROI_Frames_Selector_results.csv", help = "CSV or JSON file that the results of --batch are appended to (default: ROI_Frames_Selector_results.csv)")
+    arguments = parser.parse_args(arguments)
+    if arguments.batch is not None or arguments.list is not None:
+        patterns = arguments.batch or []
+        if arguments.list is not None:
+            with open(arguments.list) as file:
+                patterns += [line.strip() for line in file if line.strip() != ""]
+        datasets = []
+        for pattern in patterns:
+            datasets += sorted(glob.glob(pattern), key = natural_sort_key) if glob.escape(pattern) != pattern else [pattern]
+        BatchAnnotator(datasets, arguments.results, arguments.shape).run()
+        return
+    if arguments.extract is None:
+        FileSelector(tkinter.Tk())
+        return
+    first_frame, last_frame = arguments.frames or (None, None)
+    x1, y1, x2, y2 = arguments.roi or (None, None, None, None)
+    ROIExtractor(arguments.extract[0], (first_frame, last_frame, x1, y1, x2, y2, False), arguments.shape, arguments.workers).run(arguments.extract[1])
+
+if StartupTimer.enabled == True:
+    StartupTimer.record("import", time.perf_counter()-ImportStarted)
+
 #Code starts here                       
 if __name__ == "__main__":  
-    FileSelector(tkinter.Tk())
+    main()
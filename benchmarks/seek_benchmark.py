@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Per-jump latency of random access into a long video, with imageio's ffmpeg reader (what VideoBrowser used before the keyframe index)
+and with the KeyframeSeekReader of ROI_Frames_Selector.py.
+
+Run from anywhere:
+    python benchmarks/seek_benchmark.py [<video>] [--jumps 20] [--steps 30]
+Without a <video>, a synthetic 100 s 720p H.264 file (keyframe every 250 frames, the libx264 default) is written to a temporary folder.
+"""
+import os, sys
+import argparse
+import tempfile
+import time
+import numpy as np
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+import imageio
+import ROI_Frames_Selector
+
+def synthetic_video(folder, seconds = 100, fps = 30, size = (1280, 720)):
+    filename = os.path.join(folder, "synthetic_h264.mp4")
+    writer = imageio.get_writer(filename, fps = fps, codec = "libx264", quality = 6, macro_block_size = 16)
+    background = (np.random.default_rng(0).random((size[1], size[0], 3))*255).astype(np.uint8)
+    for index in range(seconds*fps):
+        frame = background.copy()
+        frame[:, (index*4) % size[0]:(index*4) % size[0]+40] = 255
+        writer.append_data(frame)
+    writer.close()
+    return filename
+
+def latencies(reader, indices):
+    times = []
+    for index in indices:
+        start = time.perf_counter()
+        reader.get_data(int(index))
+        times.append(time.perf_counter() - start)
+    return np.array(times)*1000
+
+def report(name, times):
+    print("%-28s mean %8.1f ms   median %8.1f ms   max %8.1f ms" % (name, times.mean(), np.median(times), times.max()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Random-access latency of long videos, before and after the keyframe index.")
+    parser.add_argument("video", nargs = "?", help = "video file (default: a synthetic H.264 file)")
+    parser.add_argument("--jumps", type = int, default = 20, help = "number of random slider jumps")
+    parser.add_argument("--steps", type = int, default = 30, help = "number of consecutive backward steps")
+    args = parser.parse_args()
+
+    video = args.video or synthetic_video(tempfile.mkdtemp())
+    imageio_reader = imageio.get_reader(video, mode = "?")
+    meta = imageio_reader.get_meta_data()
+    number_frames = imageio_reader.count_frames()
+    rng = np.random.default_rng(0)
+    jumps = rng.integers(0, number_frames, args.jumps)
+    steps = np.arange(number_frames//2, number_frames//2 - args.steps, -1)
+
+    start = time.perf_counter()
+    keyframe_index = ROI_Frames_Selector.KeyframeIndex(video, meta["fps"])
+    keyframe_index.build()
+    print("%s: %d frames, %d keyframes (index built in %.2f s)" % (video, number_frames, len(keyframe_index.keyframes), time.perf_counter() - start))
+    seek_reader = ROI_Frames_Selector.KeyframeSeekReader(keyframe_index, meta)
+    # VideoBrowser caches the frames a KeyframeSeekReader decodes on the way to the requested one, so backward steps within a GOP are free.
+    cached = set()
+    seek_reader.on_skip = lambda index, frame: cached.add(index)
+    
+    report("imageio: random jumps", latencies(imageio_reader, jumps))
+    report("keyframes: random jumps", latencies(seek_reader, jumps))
+    report("imageio: backward steps", latencies(imageio_reader, steps))
+    cached.clear()
+    report("keyframes: backward steps", np.array([0.0 if index in cached else latencies(seek_reader, [index])[0] for index in steps]))
+    imageio_reader.close()
+    seek_reader.close()
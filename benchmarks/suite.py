@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite of ROI_Frames_Selector.py on synthetic datasets: 8-bit and 16-bit TIFF folders, uncompressed (memory-mapped) and
+compressed multi-page TIFF stacks, a GIF and ffmpeg-encoded MP4/AVI files at several resolutions and lengths. Each dataset is opened
+in a VideoBrowser of its own process (with empty caches), which is driven from Tk's event loop with its window hidden, and the suite
+reports:
+    first_frame_ms  time from creating the VideoBrowser until the first frame is shown (before the dataset is fully opened)
+    open_ms       time from creating the VideoBrowser until its widgets are built and navigation is enabled
+    step_ms       latency of >> (p50/p90), through update_canvas and Tk
+    jump_ms       latency of random slider jumps (p50/p90)
+    scrub_fps     frames shown per second while the slider is dragged continuously
+    peak_rss_mb   peak resident memory of the process
+and, once per run, the startup of the program in a fresh interpreter (median of 5):
+    import_ms        import of ROI_Frames_Selector
+    first_window_ms  from the start of the import until the FileSelector window is drawn
+Without a display (or with --pipeline), the frame pipeline is measured without Tk instead: the dataset is opened by VideoBrowser.preload()
+and step_ms and jump_ms are the latencies of load_frame() (decode, reduce_frame() and display_frame()) for the same steps and jumps. The
+scrub and first window measurements need Tk and are left out.
+Results are written as JSON; pass an earlier results file with --compare to see the change of every number.
+
+Run from anywhere (with xvfb-run on a headless machine for the full measurements):
+    python benchmarks/suite.py [--quick] [--pipeline] [--output results.json] [--compare previous.json] [--only mp4_480p,gif]
+Datasets are generated once in --data (default: a folder in the temporary directory) and reused by later runs.
+"""
+import os, sys
+import argparse
+import json
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import numpy as np
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+import imageio
+import tkinter
+import ROI_Frames_Selector
+try:
+    import resource
+except ImportError: # Windows: peak memory is not reported.
+    resource = None
+
+# name: (kind, frames, width, height) for the full suite and for --quick
+DATASETS = {
+    "tiff8_folder": ("tiff8", 200, 1024, 1024),
+    "tiff16_folder": ("tiff16", 60, 2048, 2048),
+    "multipage_tiff16": ("stack", 100, 1024, 1024),
+    "compressed_tiff16": ("compressed_stack", 100, 1024, 1024),
+    "gif": ("gif", 100, 320, 240),
+    "mp4_480p": ("mp4", 300, 640, 480),
+    "mp4_1080p_long": ("mp4", 3000, 1920, 1080),
+    "avi_480p": ("avi", 300, 640, 480),
+}
+QUICK_DATASETS = {
+    "tiff8_folder": ("tiff8", 40, 512, 512),
+    "tiff16_folder": ("tiff16", 20, 1024, 1024),
+    "multipage_tiff16": ("stack", 20, 512, 512),
+    "compressed_tiff16": ("compressed_stack", 20, 512, 512),
+    "gif": ("gif", 20, 320, 240),
+    "mp4_480p": ("mp4", 100, 640, 480),
+    "avi_480p": ("avi", 100, 640, 480),
+}
+
+# Frames of the image datasets: a bright square crossing a noisy background, the same for every run.
+def synthetic_frames(number_frames, width, height, dtype):
+    background = np.random.default_rng(0).random((height, width))*0.2
+    peak = np.iinfo(dtype).max
+    for index in range(number_frames):
+        frame = background.copy()
+        x = int(index*(width-height//8)/max(number_frames-1, 1))
+        frame[height//2-height//16:height//2+height//16, x:x+height//8] = 1
+        yield (frame*peak).astype(dtype)
+
+def make_dataset(folder, name, kind, number_frames, width, height):
+    if kind in ("tiff8", "tiff16"):
+        path = os.path.join(folder, name)
+        os.makedirs(path)
+        for index, frame in enumerate(synthetic_frames(number_frames, width, height, np.uint8 if kind == "tiff8" else np.uint16)):
+            imageio.imwrite(os.path.join(path, "frame_%d.tif" % index), frame)
+        return path + os.sep
+    if kind in ("stack", "compressed_stack"):
+        # One series of pages: uncompressed, it is memory-mapped by ROI_Frames_Selector; compressed, it is read page by page.
+        import tifffile
+        path = os.path.join(folder, name + ".tif")
+        tifffile.imwrite(path, np.stack(list(synthetic_frames(number_frames, width, height, np.uint16))), compression = "zlib" if kind == "compressed_stack" else None)
+        return path
+    if kind == "gif":
+        path = os.path.join(folder, name + ".gif")
+        imageio.mimwrite(path, [np.dstack([frame]*3) for frame in synthetic_frames(number_frames, width, height, np.uint8)])
+        return path
+    # Videos come straight from ffmpeg's test source, which is much faster than piping frames from Python.
+    import imageio_ffmpeg
+    path = os.path.join(folder, name + "." + kind)
+    codec = ["-c:v", "libx264", "-pix_fmt", "yuv420p"] if kind == "mp4" else ["-c:v", "mpeg4", "-q:v", "5"]
+    subprocess.run([imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc2=size=%dx%d:rate=25" % (width, height),
+                    "-frames:v", str(number_frames)] + codec + [path], check = True)
+    return path
+
+def dataset_path(folder, name, specification):
+    marker = os.path.join(folder, name + ".json") # Written last, so a dataset cut short by an interruption is made again.
+    try:
+        with open(marker) as file:
+            stored = json.load(file)
+        if stored["specification"] == list(specification):
+            return stored["path"]
+    except (OSError, ValueError, KeyError):
+        pass
+    for leftover in (os.path.join(folder, name), os.path.join(folder, name + ".tif")):
+        if os.path.isdir(leftover):
+            shutil.rmtree(leftover)
+    path = make_dataset(folder, name, *specification)
+    with open(marker, "w") as file:
+        json.dump({"specification": list(specification), "path": path}, file)
+    return path
+
+def percentiles(times):
+    return {"p50": float(np.percentile(times, 50)*1000), "p90": float(np.percentile(times, 90)*1000)}
+
+class BenchmarkBrowser(ROI_Frames_Selector.VideoBrowser):
+    # A VideoBrowser that measures itself: measure() is queued as soon as the dataset is open, so it is the next thing its event loop runs.
+    def __init__(self, window, multimedia, steps, jumps, scrub_seconds):
+        self.steps, self.jumps, self.scrub_seconds = steps, jumps, scrub_seconds
+        self.measurements = {}
+        self.shown = None # Slider positions whose frame was shown, while the slider is dragged
+        self.started = time.perf_counter()
+        window.withdraw()
+        super().__init__(window, multimedia)
+
+    def show_preview(self, frame):
+        super().show_preview(frame)
+        self.measurements.setdefault("first_frame_ms", (time.perf_counter()-self.started)*1000) # Folders may show a second preview
+
+    def build_browser(self):
+        super().build_browser()
+        self.measurements["open_ms"] = (time.perf_counter()-self.started)*1000
+        self.window.after(0, self.measure)
+
+    # Frames of the slider position are shown at once by scrub() if they are cached, or later by show_scrubbed_frame() if the position is still
+    # the same when the scrub decoder delivers them. The nearest cached frame that stands in meanwhile is not counted.
+    def scrub(self):
+        if self.shown is not None and self.zoom == self.fit_zoom and (self.index in self.frame_cache or (self.proxies is not None and self.index in self.proxies)):
+            self.shown.append(self.index)
+        super().scrub()
+
+    def show_scrubbed_frame(self, index, frame):
+        if self.shown is not None and index == self.index and self.zoom == self.fit_zoom:
+            self.shown.append(index)
+        super().show_scrubbed_frame(index, frame)
+
+    def measure(self):
+        self.measurements["number_frames"] = self.number_frames
+        while self.listing_complete == False: # Folders are sorted in the background before navigation is enabled.
+            self.window.update()
+        times = []
+        for step in range(min(self.steps, self.number_frames-1)):
+            start = time.perf_counter()
+            self.forward()
+            self.window.update_idletasks()
+            times.append(time.perf_counter()-start)
+        if times != []:
+            self.measurements["step_ms"] = percentiles(times)
+        times = []
+        for index in np.random.default_rng(0).integers(0, self.number_frames, self.jumps if self.number_frames > 1 else 0):
+            start = time.perf_counter()
+            self.direction = 1 if index > self.index else -1
+            self.index = int(index)
+            self.scrrect.set(self.index+1)
+            self.scrollrect1(None)
+            self.window.update_idletasks()
+            times.append(time.perf_counter()-start)
+        if self.number_frames > 1:
+            self.measurements["jump_ms"] = percentiles(times)
+            self.measurements["scrub_fps"] = self.drag_slider()
+        self.continue_program()
+
+    # Drag the slider from one end to the other (and back) at one position per Tk event-loop pass, counting the frames of the slider position shown.
+    def drag_slider(self):
+        self.shown = []
+        start = time.perf_counter()
+        position, step = 1, max(1, self.number_frames//200)
+        while time.perf_counter()-start < self.scrub_seconds:
+            position += step
+            if position < 1 or position > self.number_frames:
+                step = -step
+                position += 2*step
+            self.scrrect.set(position)
+            self.scrollrect(position)
+            self.window.update()
+        shown, self.shown = self.shown, None
+        return len(shown)/(time.perf_counter()-start)
+
+# The pipeline behind the canvas, without Tk: open the dataset with VideoBrowser.preload() and time load_frame() for the steps and jumps.
+# The proxy store is off, so every frame is decoded. Results of background work that would update the widgets are applied here instead.
+def measure_pipeline(multimedia, steps, jumps):
+    ROI_Frames_Selector.ProxyCacheMB = 0
+    measurements = {}
+    started = time.perf_counter()
+    browser = ROI_Frames_Selector.VideoBrowser.preload(multimedia)
+    opened = False
+    while opened == False or browser.listing_complete == False: # Folders are sorted in the background before navigation is enabled.
+        handler, args = browser.events.get(timeout = 600)
+        if handler == browser.show_preview:
+            measurements.setdefault("first_frame_ms", (time.perf_counter()-started)*1000) # Folders may show a second preview
+        elif handler == browser.build_browser:
+            measurements["open_ms"] = (time.perf_counter()-started)*1000
+            opened = True
+        elif handler == browser.set_filelist:
+            browser.filelist = args[0]
+            browser.image_set.filelist = args[0]
+            browser.listing_complete = True
+        elif handler == browser.open_failed:
+            raise args[0]
+    measurements["number_frames"] = browser.number_frames
+    times = []
+    for index in range(1, min(steps, browser.number_frames-1)+1):
+        start = time.perf_counter()
+        browser.load_frame(index)
+        times.append(time.perf_counter()-start)
+    if times != []:
+        measurements["step_ms"] = percentiles(times)
+    times = []
+    for index in np.random.default_rng(0).integers(0, browser.number_frames, jumps if browser.number_frames > 1 else 0):
+        start = time.perf_counter()
+        browser.load_frame(int(index))
+        times.append(time.perf_counter()-start)
+    if times != []:
+        measurements["jump_ms"] = percentiles(times)
+    browser.discard()
+    return measurements
+
+def run_case(multimedia, steps, jumps, scrub_seconds, pipeline, result_file):
+    ROI_Frames_Selector.CacheDirectory = tempfile.mkdtemp() # Cold caches: no keyframe index, proxies or folder listing from earlier runs.
+    try:
+        if pipeline == True:
+            measurements = measure_pipeline(multimedia, steps, jumps)
+        else:
+            measurements = BenchmarkBrowser(tkinter.Tk(), multimedia, steps, jumps, scrub_seconds).measurements
+    finally:
+        shutil.rmtree(ROI_Frames_Selector.CacheDirectory, ignore_errors = True)
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        measurements["peak_rss_mb"] = peak/2**20 if sys.platform == "darwin" else peak/2**10 # bytes on macOS, kB elsewhere
+    with open(result_file, "w") as file:
+        json.dump(measurements, file)
+
+# Run in a fresh interpreter: the FileSelector's own idle callback (which starts the warm-up imports) is queued after this one.
+STARTUP = """
+import sys, time
+started = time.perf_counter()
+sys.path.insert(0, %r)
+import tkinter
+import ROI_Frames_Selector
+imported = time.perf_counter()
+root = tkinter.Tk()
+root.after_idle(lambda: (print((imported-started)*1000, (time.perf_counter()-started)*1000), root.destroy()))
+ROI_Frames_Selector.FileSelector(root)
+"""
+# Without a display only the import is timed.
+IMPORT = """
+import sys, time
+started = time.perf_counter()
+sys.path.insert(0, %r)
+import ROI_Frames_Selector
+print((time.perf_counter()-started)*1000)
+"""
+
+def measure_startup(window, runs = 5):
+    times = []
+    for run in range(runs):
+        output = subprocess.run([sys.executable, "-c", (STARTUP if window == True else IMPORT) % REPOSITORY], check = True, capture_output = True, text = True).stdout
+        times.append([float(value) for value in output.split()[:2]])
+    medians = np.median(times, axis = 0)
+    return {metric: float(value) for metric, value in zip(("import_ms", "first_window_ms"), medians)}
+
+# Whether Tk can open a window here.
+def has_display():
+    try:
+        tkinter.Tk().destroy()
+    except tkinter.TclError:
+        return False
+    return True
+
+def flatten(measurements, prefix = ""):
+    values = {}
+    for key, value in measurements.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, prefix + key + "."))
+        else:
+            values[prefix + key] = value
+    return values
+
+def compare(results, previous):
+    print("\n%-20s %-22s %12s %12s %8s" % ("dataset", "metric", "previous", "now", "change"))
+    for name, measurements in results.items():
+        before = flatten(previous.get(name, {}))
+        for metric, value in flatten(measurements).items():
+            if metric in before and isinstance(value, (int, float)) and before[metric]:
+                print("%-20s %-22s %12.2f %12.2f %+7.1f%%" % (name, metric, before[metric], value, 100*(value-before[metric])/before[metric]))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Open, step, jump and scrub benchmarks of ROI_Frames_Selector on synthetic datasets.")
+    parser.add_argument("--quick", action = "store_true", help = "small datasets, for a check in a minute or two")
+    parser.add_argument("--only", default = None, help = "comma-separated dataset names (default: all)")
+    parser.add_argument("--data", default = os.path.join(tempfile.gettempdir(), "ROI_Frames_Selector_benchmarks"), help = "folder of the generated datasets")
+    parser.add_argument("--output", default = "benchmark_results.json", help = "JSON file to write the results to")
+    parser.add_argument("--compare", default = None, help = "JSON results of an earlier run to compare with")
+    parser.add_argument("--steps", type = int, default = 50, help = "number of >> steps")
+    parser.add_argument("--jumps", type = int, default = 20, help = "number of random slider jumps")
+    parser.add_argument("--scrub-seconds", type = float, default = 3, help = "duration of the slider drag")
+    parser.add_argument("--pipeline", action = "store_true", help = "measure the frame pipeline without Tk (the default when there is no display)")
+    parser.add_argument("--case", default = None, help = argparse.SUPPRESS) # Internal: measure one dataset in this process
+    parser.add_argument("--result", default = None, help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        run_case(args.case, args.steps, args.jumps, args.scrub_seconds, args.pipeline, args.result)
+        sys.exit(0)
+
+    datasets = QUICK_DATASETS if args.quick == True else DATASETS
+    if args.only is not None:
+        datasets = {name: datasets[name] for name in args.only.split(",")}
+    folder = os.path.join(args.data, "quick" if args.quick == True else "full")
+    os.makedirs(folder, exist_ok = True)
+    pipeline = args.pipeline == True or has_display() == False
+    if pipeline == True and args.pipeline == False:
+        print("No display: measuring the frame pipeline without Tk (no scrub or first window measurements).")
+    results = {"startup": measure_startup(pipeline == False)}
+    print("%-20s import %6.1f ms   first window %6.1f ms" % ("startup", results["startup"]["import_ms"], results["startup"].get("first_window_ms", float("nan"))))
+    with tempfile.TemporaryDirectory() as scratch: # Result files of the cases
+        for name, specification in datasets.items():
+            path = dataset_path(folder, name, specification)
+            result_file = os.path.join(scratch, name + ".json")
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--case", path, "--result", result_file, "--steps", str(args.steps),
+                            "--jumps", str(args.jumps), "--scrub-seconds", str(args.scrub_seconds)] + (["--pipeline"] if pipeline == True else []),
+                           check = True, stdout = subprocess.DEVNULL)
+            with open(result_file) as file:
+                results[name] = json.load(file)
+            measurements = results[name]
+            print("%-20s first frame %8.1f ms   open %8.1f ms   step p50 %7.1f ms   jump p50 %7.1f ms   scrub %6.1f fps   peak %7.1f MB" % (name, measurements["first_frame_ms"], measurements["open_ms"],
+                  measurements.get("step_ms", {}).get("p50", float("nan")), measurements.get("jump_ms", {}).get("p50", float("nan")),
+                  measurements.get("scrub_fps", float("nan")), measurements.get("peak_rss_mb", float("nan"))))
+
+    output = os.path.abspath(args.output)
+    with open(output, "w") as file:
+        json.dump({"time": time.strftime("%Y-%m-%d %H:%M:%S"), "python": sys.version.split()[0], "platform": platform.platform(),
+                   "quick": args.quick, "pipeline": pipeline, "results": results}, file, indent = 1)
+    print("Results written to " + output)
+    if args.compare is not None:
+        with open(args.compare) as file:
+            previous = json.load(file)
+        if previous.get("pipeline", False) != pipeline: # Pipeline latencies leave out Tk, so they are not comparable with the full ones.
+            print("\nWarning: %s was measured %s Tk." % (args.compare, "without" if previous.get("pipeline", False) == True else "with"))
+        compare(results, previous["results"])
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of memmap_file() and open_source(): greyscale and RGB frames stored in .npy and TIFF files come out as frames along the first axis.
+
+Run from the repository: python -m pytest tests
+"""
+import os, sys
+import numpy as np
+import pytest
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+import ROI_Frames_Selector
+
+Frames = np.random.default_rng(0).integers(0, 256, (5, 16, 20, 3), dtype = np.uint8)
+
+def test_npy_greyscale_stack(tmp_path):
+    np.save(tmp_path / "grey.npy", Frames[..., 0])
+    frames = ROI_Frames_Selector.memmap_file(str(tmp_path / "grey.npy"))
+    assert frames.shape == (5, 16, 20)
+    assert np.array_equal(frames, Frames[..., 0])
+
+def test_npy_rgb_image(tmp_path):
+    np.save(tmp_path / "rgb.npy", Frames[0])
+    frames = ROI_Frames_Selector.memmap_file(str(tmp_path / "rgb.npy"))
+    assert frames.shape == (1, 16, 20, 3)
+    assert np.array_equal(frames[0], Frames[0])
+
+def test_npy_rgb_stack(tmp_path):
+    np.save(tmp_path / "rgb_stack.npy", Frames)
+    frames = ROI_Frames_Selector.memmap_file(str(tmp_path / "rgb_stack.npy"))
+    assert frames.shape == (5, 16, 20, 3)
+    assert np.array_equal(frames, Frames)
+
+def test_tiff_rgb_stack(tmp_path):
+    tifffile = pytest.importorskip("tifffile")
+    tifffile.imwrite(tmp_path / "rgb_stack.tif", Frames, photometric = "rgb")
+    frames = ROI_Frames_Selector.memmap_file(str(tmp_path / "rgb_stack.tif"))
+    assert frames.shape == (5, 16, 20, 3)
+    assert np.array_equal(frames, Frames)
+
+def test_tiff_planar_rgb(tmp_path):
+    tifffile = pytest.importorskip("tifffile")
+    tifffile.imwrite(tmp_path / "planar.tif", np.moveaxis(Frames[0], -1, 0), photometric = "rgb", planarconfig = "separate")
+    frames = ROI_Frames_Selector.memmap_file(str(tmp_path / "planar.tif"))
+    assert frames.shape == (1, 16, 20, 3)
+    assert np.array_equal(frames[0], Frames[0])
+
+def test_tiff_planar_rgb_stack(tmp_path):
+    tifffile = pytest.importorskip("tifffile")
+    tifffile.imwrite(tmp_path / "planar_stack.tif", np.moveaxis(Frames, -1, 1), photometric = "rgb", planarconfig = "separate")
+    frames = ROI_Frames_Selector.memmap_file(str(tmp_path / "planar_stack.tif"))
+    assert frames.shape == (5, 16, 20, 3)
+    assert np.array_equal(frames, Frames)
+
+def test_tiff_big_endian(tmp_path):
+    tifffile = pytest.importorskip("tifffile")
+    data = Frames[..., 0].astype(np.uint16)*257
+    tifffile.imwrite(tmp_path / "big_endian.tif", data, byteorder = ">")
+    frames = ROI_Frames_Selector.memmap_file(str(tmp_path / "big_endian.tif"))
+    assert np.array_equal(frames, data)
+
+def test_compressed_tiff_is_not_mapped(tmp_path):
+    tifffile = pytest.importorskip("tifffile")
+    tifffile.imwrite(tmp_path / "compressed.tif", Frames, photometric = "rgb", compression = "zlib")
+    assert ROI_Frames_Selector.memmap_file(str(tmp_path / "compressed.tif")) is None
+
+def test_image_sequence(tmp_path):
+    tifffile = pytest.importorskip("tifffile")
+    filelist = []
+    for index, frame in enumerate(Frames):
+        filelist.append(str(tmp_path / ("frame_%d.tif" % index)))
+        tifffile.imwrite(filelist[-1], frame, photometric = "rgb")
+    sequence = ROI_Frames_Selector.ImageSequence(filelist)
+    assert sequence.mappable == True
+    assert np.array_equal(sequence.get_data(3), Frames[3])
+
+def test_compressed_tiff_stack_pages(tmp_path):
+    tifffile = pytest.importorskip("tifffile")
+    tifffile.imwrite(tmp_path / "compressed_stack.tif", Frames, photometric = "rgb", compression = "zlib")
+    reader = ROI_Frames_Selector.open_source(str(tmp_path / "compressed_stack.tif"))
+    assert reader.get_length() == 5
+    assert np.array_equal(reader.get_data(3), Frames[3])
+    reader.close()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of suggest_frame_range() on the difference energies of a real dataset (Examples/Image_Directory) and of synthetic clips.
+
+Run from the repository: python -m pytest tests
+"""
+import os, sys
+import numpy as np
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+import imageio
+import ROI_Frames_Selector
+
+def test_droplets_example():
+    folder = os.path.join(REPOSITORY, "Examples", "Image_Directory")
+    filelist = sorted(os.path.join(folder, name) for name in os.listdir(folder))
+    frames = np.asarray([imageio.v2.imread(filename)[::4, ::4] for filename in filelist], dtype = np.float32)
+    suggestion = ROI_Frames_Selector.suggest_frame_range(ROI_Frames_Selector.difference_energy(frames, None))
+    assert suggestion is not None
+    # The droplets move fastest over frames 12 to 29.
+    assert suggestion[0] <= 12 and suggestion[1] >= 29
+
+def test_constant_background():
+    frames = np.zeros((1000, 96, 128), dtype = np.float32)
+    for index in range(500, 521): # A square crossing the scene
+        frames[index, 40:60, 5*(index-500):5*(index-500)+20] = 200
+    frames[59:, 10, 10] = 3 # Changes of a few grey levels in single pixels are not activity.
+    frames[940:, 80, 100] = 3
+    suggestion = ROI_Frames_Selector.suggest_frame_range(ROI_Frames_Selector.difference_energy(frames, None))
+    assert suggestion is not None
+    assert 495 <= suggestion[0] <= 500 and 520 <= suggestion[1] <= 526
+
+def test_noisy_background():
+    frames = np.random.default_rng(0).normal(100, 3, (300, 96, 128)).astype(np.float32)
+    frames[150:170, 40:60, 40:60] += 50
+    suggestion = ROI_Frames_Selector.suggest_frame_range(ROI_Frames_Selector.difference_energy(frames, None))
+    assert suggestion is not None
+    assert 145 <= suggestion[0] <= 149 and 170 <= suggestion[1] <= 175
+
+def test_static_clip():
+    frames = np.random.default_rng(0).normal(100, 3, (300, 96, 128)).astype(np.float32)
+    assert ROI_Frames_Selector.suggest_frame_range(ROI_Frames_Selector.difference_energy(frames, None)) is None
+
+def test_active_throughout():
+    rng = np.random.default_rng(0)
+    frames = np.zeros((100, 96, 128), dtype = np.float32)
+    for index in range(100): # Squares of varying size moving in every frame
+        size = rng.integers(5, 40)
+        x, y = rng.integers(0, 128-size), rng.integers(0, 96-size)
+        frames[index, y:y+size, x:x+size] = 200
+    assert ROI_Frames_Selector.suggest_frame_range(ROI_Frames_Selector.difference_energy(frames, None)) == (0, 99)